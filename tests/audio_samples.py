@@ -0,0 +1,104 @@
+"""Small, deterministic BFWAV, BFSTM and BARS files for the sound converter tests"""
+
+import random
+import struct
+
+def random_bytes(rng, size):
+    return rng.getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+
+def bfwav(rng, nsamples=5000, codec=1):
+    info_off = 0x40
+    info = b'INFO' + struct.pack('>I', 0x30) + struct.pack('>2B2x4I', codec, 0, 48000, 0, nsamples, 0) + struct.pack('>I', 0)
+    info = info.ljust(0x30, b'\0')
+    data_off = info_off + len(info)
+    samples = random_bytes(rng, nsamples * 2)
+    data = b'DATA' + struct.pack('>I', 8 + len(samples)) + samples
+    total = data_off + len(data)
+    header = b'FWAV' + b'\xFE\xFF' + struct.pack('>H2I2H', 0x40, 0x10100, total, 2, 0)
+    refs = struct.pack('>H2xiI', 0x7000, info_off, len(info)) + struct.pack('>H2xiI', 0x7001, data_off, len(data))
+    return (header + refs).ljust(0x40, b'\0') + info + data
+
+def amta(rng, name):
+    subs = [(b'DATA', random_bytes(rng, 12 + 4 * 5)), (b'MARK', random_bytes(rng, 8)),
+            (b'EXT_', random_bytes(rng, 4)), (b'STRG', name.encode() + b'\0\0\0\0')]
+    body = b''.join(magic + struct.pack('>I', len(data)) + data for magic, data in subs)
+    return b'AMTA' + struct.pack('>2H5I', 0xFEFF, 0, 0x1C + len(body), 0, 0, 0, 0) + body
+
+def bars(rng, tracks):
+    # tracks are (name, track data) pairs
+    count = len(tracks)
+    pos = 0x10 + count * 4 + count * 8
+    amtas = []
+    for name, _ in tracks:
+        data = amta(rng, name)
+        data = data.ljust((len(data) + 3) // 4 * 4, b'\0')
+        amtas.append((pos, data))
+        pos += len(data)
+    track_offsets = []
+    for _, track in tracks:
+        pos = (pos + 0x1F) // 0x20 * 0x20
+        track_offsets.append(pos)
+        pos += len(track)
+
+    buf = bytearray(pos)
+    buf[0:0x10] = b'BARS' + struct.pack('>I2HI', pos, 0xFEFF, 0x101, count)
+    buf[0x10:0x10 + count * 4] = random_bytes(rng, count * 4)
+    for i in range(count):
+        struct.pack_into('>2I', buf, 0x10 + count * 4 + i * 8, amtas[i][0], track_offsets[i])
+        buf[amtas[i][0]:amtas[i][0] + len(amtas[i][1])] = amtas[i][1]
+        buf[track_offsets[i]:track_offsets[i] + len(tracks[i][1])] = tracks[i][1]
+    return bytes(buf)
+
+def bfstm(rng, nsamples=3000, codec=1, bom='>'):
+    p = lambda fmt, *args: struct.pack(bom + fmt, *args)
+    info_off = 0x40
+    stm_rel = 0x20
+    stminfo = p('4B11I', codec, 0, 1, 0, 48000, 0, nsamples, 1, nsamples * 2, nsamples, nsamples * 2, nsamples, 0, 4, 0)
+    stminfo += p('H2xi', 0x1F00, 0x18) + p('H2xH2xi3I', 0x100, 0, -1, 0, 0, 0)
+    chtab_rel = stm_rel + len(stminfo)
+    # Channel table: count, ref -> channel info -> adpcm ref -> dsp context
+    chtab = p('I', 1) + p('H2xi', 0x4102, 0xC)
+    chinfo = p('H2xi', 0x0300, 8)
+    dsp = random_bytes(rng, 32) + p('3H', 1, 2, 3) + p('3H', 4, 5, 6) + b'\0\0'
+    body = p('H2xi', 0x4100, stm_rel) + p('H2xi', 0x0101, -1) + p('H2xi', 0x0101, chtab_rel)
+    body = body.ljust(stm_rel, b'\0') + stminfo + chtab + chinfo + dsp
+    info = b'INFO' + p('I', 8 + len(body)) + body
+    info = info.ljust((len(info) + 0x1F) // 0x20 * 0x20, b'\0')
+    info = info[:4] + p('I', len(info)) + info[8:]
+    seek_off = info_off + len(info)
+    seek_data = random_bytes(rng, 0x18)
+    seek = b'SEEK' + p('I', 8 + len(seek_data)) + seek_data
+    data_off = (seek_off + len(seek) + 0x1F) // 0x20 * 0x20
+    samples = random_bytes(rng, nsamples * 2)
+    data = b'DATA' + p('I', 0x20 + len(samples)) + bytes(0x18) + samples
+    total = data_off + len(data)
+    header = b'FSTM' + (b'\xFE\xFF' if bom == '>' else b'\xFF\xFE') + p('H2I2H', 0x40, 0x40000, total, 3, 0)
+    refs = p('H2xiI', 0x4000, info_off, len(info)) + p('H2xiI', 0x4001, seek_off, len(seek)) + p('H2xiI', 0x4002, data_off, len(data))
+
+    out = bytearray(total)
+    out[:0x40] = (header + refs).ljust(0x40, b'\0')
+    out[info_off:info_off + len(info)] = info
+    out[seek_off:seek_off + len(seek)] = seek
+    out[data_off:] = data
+    return bytes(out)
+
+def samples():
+    """
+    Every sample conversion of the tests, as (case name, input, function
+    name in bars_py, arguments after the input)
+    """
+    rng = random.Random(0x5EED)
+    cases = []
+    for codec in (1, 2):
+        for bom in '<>':
+            stm = bfstm(rng, codec=codec, bom=bom)
+            for dest in ("FSTM", "CSTM", "FSTP"):
+                for dest_bom in '<>':
+                    cases.append((f"bfstm-{codec}{bom}-{dest}{dest_bom}", stm, "STMtoSTM", ("FSTM", dest, dest_bom)))
+    wav = bfwav(rng)
+    for dest in ("FWAV", "CWAV"):
+        for dest_bom in '<>':
+            cases.append((f"bfwav-{dest}{dest_bom}", wav, "WAVtoWAV", ("FWAV", dest, dest_bom)))
+    tracks = [(f"t{i}", bfwav(rng, 200 + i)) for i in range(40)]
+    cases.append(("bars", bars(rng, tracks), "convert_bars", ('<',)))
+    return cases
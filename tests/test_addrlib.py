@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+from ubotw_converter.bflim_convertor.addrlib import addrlib
+
+# (GX2 format, name) of the surfaces checked: RGBA8, BC1 and BC3
+FORMATS = [(0x1a, "rgba8"), (0x31, "bc1"), (0x33, "bc3")]
+TILE_MODES = [1, 2, 3, 4, 7]
+
+def reference_swizzle(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                      pitch, bitsPerPixel, slice, sample, data, swizzle):
+    # swizzleSurf as it was before its address maps were cached, one texel at a time
+    bytesPerPixel = bitsPerPixel // 8
+    result = bytearray(len(data))
+
+    if format_ in addrlib.BCn_formats:
+        width = (width + 3) // 4
+        height = (height + 3) // 4
+
+    pipeSwizzle = (swizzle_ >> 8) & 1
+    bankSwizzle = (swizzle_ >> 9) & 3
+    tileMode = addrlib.GX2TileModeToAddrTileMode(tileMode)
+
+    for y in range(height):
+        for x in range(width):
+            if tileMode in [0, 1]:
+                pos = addrlib.computeSurfaceAddrFromCoordLinear(x, y, slice, sample, bytesPerPixel, pitch, height, depth)
+            elif tileMode in [2, 3]:
+                pos = addrlib.computeSurfaceAddrFromCoordMicroTiled(x, y, slice, bitsPerPixel, pitch, height, tileMode, bool(use & 4))
+            else:
+                pos = addrlib.computeSurfaceAddrFromCoordMacroTiled(x, y, slice, sample, bitsPerPixel, pitch, height, 1 << aa,
+                                                                    tileMode, bool(use & 4), pipeSwizzle, bankSwizzle)
+
+            pos_ = (y * width + x) * bytesPerPixel
+            if pos_ + bytesPerPixel <= len(data) and pos + bytesPerPixel <= len(data):
+                if swizzle == 0:
+                    result[pos_:pos_ + bytesPerPixel] = data[pos:pos + bytesPerPixel]
+                else:
+                    result[pos:pos + bytesPerPixel] = data[pos_:pos_ + bytesPerPixel]
+
+    return bytes(result)
+
+def surfaces():
+    # Random surfaces of every format and tile mode, sometimes with their data cut short
+    rng = random.Random(0xADD7)
+    cases = []
+    for format_, name in FORMATS:
+        for tileMode in TILE_MODES:
+            for i in range(3):
+                width, height = rng.randint(1, 160), rng.randint(1, 160)
+                swizzle_ = rng.choice([0, 0x100, 0x200, 0x700])
+                surfOut = addrlib.getSurfaceInfo(format_, width, height, 1, 1, tileMode, 0, 0)
+                size = surfOut.surfSize
+                if i == 2:
+                    size = rng.randrange(1, size)
+                data = bytes(rng.getrandbits(8) for _ in range(size))
+                args = (width, height, 1, format_, 0, 1, surfOut.tileMode, swizzle_, surfOut.pitch, surfOut.bpp, 0, 0, data)
+                cases.append((f"{name}-{tileMode}-{i}", args))
+    return cases
+
+SURFACES = surfaces()
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = addrlib.AddrMapCache(maxSize=4)
+    monkeypatch.setattr(addrlib, "addrMapCache", cache)
+    return cache
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+@pytest.mark.parametrize("name, args", SURFACES, ids=[case[0] for case in SURFACES])
+def test_swizzle_surf_matches_reference(cache, monkeypatch, name, args, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(addrlib, "np", None)
+
+    data = args[-1]
+    for swizzle in (0, 1):
+        expected = reference_swizzle(*args, swizzle)
+        assert addrlib.swizzleSurf(*args, len(data), swizzle) == expected
+        # The second call reuses the cached map
+        assert addrlib.swizzleSurf(*args, len(data), swizzle) == expected
+    assert cache.info() == (3, 1, 1, 4)
+
+def test_addr_map_fits_in_32_bits():
+    _, args = SURFACES[0]
+    data = args[-1]
+    addrMap = addrlib.computeAddrMap(*args[:-1], len(data))
+    assert addrMap.itemsize == 4
+    assert len(addrMap) == args[0] * args[1]
+
+def test_cache_counts_hits_and_misses():
+    cache = addrlib.AddrMapCache(maxSize=2)
+    built = []
+
+    def build(*key):
+        built.append(key)
+        return key
+
+    assert cache.get((1,), build) == (1,)
+    assert cache.get((1,), build) == (1,)
+    assert cache.get((2,), build) == (2,)
+    assert built == [(1,), (2,)]
+    assert cache.info() == (1, 2, 2, 2)
+
+    cache.clear()
+    assert cache.info() == (0, 0, 0, 2)
+
+def test_cache_evicts_least_recently_used():
+    cache = addrlib.AddrMapCache(maxSize=2)
+    build = lambda *key: key
+
+    cache.get((1,), build)
+    cache.get((2,), build)
+    # 1 was used last, so 2 is evicted
+    cache.get((1,), build)
+    cache.get((3,), build)
+    assert list(cache.maps) == [(1,), (3,)]
+    assert cache.info() == (1, 3, 2, 2)
+
+    cache.resize(1)
+    assert list(cache.maps) == [(3,)]
+    assert cache.info() == (1, 3, 1, 1)
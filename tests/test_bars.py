@@ -0,0 +1,93 @@
+import hashlib
+import io
+import random
+
+import pytest
+
+from ubotw_converter.bars_py import bars, bcf_converter
+
+from audio_samples import bars as make_bars, bfstm, samples
+
+# SHA-256 of every sample converted by bars_py before its sections were
+# swapped in bulk, the new code must give the exact same bytes
+EXPECTED = {
+    "bfstm-1<-FSTM<": "c4af9d084fa9a9b96645019d6cd5df417f3e2badb8c4f0b5836152ce59269eb5",
+    "bfstm-1<-FSTM>": "038f444310be92de94d1a7df975738a5d1c508f7bd93fa729a0995159499da7f",
+    "bfstm-1<-CSTM<": "222fc17120e3e81e20fcf73dd461e65230f3c04a80f0c724fb9015ac72d7535e",
+    "bfstm-1<-CSTM>": "2a955c57142944c6697be64c007747c880ccd0cc936f225aba1768d637424932",
+    "bfstm-1<-FSTP<": "f32b8cf5b4b91b2421f58ffa6da27b061f7d2979dd17016f769ed80a272eec9a",
+    "bfstm-1<-FSTP>": "775750f915f604acf0a7c1416429c2fc4f3310ec85de7fd2c134218438dc7895",
+    "bfstm-1>-FSTM<": "31dabbfd03df4b365175660a93571f32af92cd568ef2eed3629dd32caf1d475e",
+    "bfstm-1>-FSTM>": "0d7f2e721f772b1949db7ed98836793db688a97b1244c3920780acf5e98717fb",
+    "bfstm-1>-CSTM<": "0ce3cd66086bcada78fb8c093260655251865b7b182f360dad01ac7694ff71d7",
+    "bfstm-1>-CSTM>": "cd8efe0c4f7319aaf79256112ef2bcd03e2918e6b4a7dc0d145236999a64996a",
+    "bfstm-1>-FSTP<": "5bb567ba0543adf82f1e3bc5fa2a444e8bcd24958a4384a9b135a5469f71967e",
+    "bfstm-1>-FSTP>": "9fcc6f3a79d59fcd955b4bc625243e37769c002bf0e3fd332589a6a94c4a306d",
+    "bfstm-2<-FSTM<": "039d1e73d7ede96e08804158c32d6aa42dd4d78f88131c6b9acc5c7e95669e68",
+    "bfstm-2<-FSTM>": "c5dc778b59b42ba537dc7e7a561ff3cf90c0892d5e069f339b51d951dba673a6",
+    "bfstm-2<-CSTM<": "c7db2d0cfb795405596ccad19532e79e2eb232a854f3351e51b90a2b30399390",
+    "bfstm-2<-CSTM>": "b43748cdadef694ce354925ba0d7e4f7e28fdbcd749c96dc1d36536c9dec21f2",
+    "bfstm-2<-FSTP<": "84213dd358a0ad3cb154be37065cbfd079f6ef8af4645f57d422319279ed8fad",
+    "bfstm-2<-FSTP>": "731d927b9795dfe112c8ff3efa3764e1d0b36d39630fcb7a35f27aa3122e1281",
+    "bfstm-2>-FSTM<": "86e5fae2ddde77d4ff48929c0744ef2b163b5b17e1713c81392695267ea35a68",
+    "bfstm-2>-FSTM>": "c8e6d7a149840bfe130dca1ad6681b03748f4dfd23ef58a19bdc2eba90125621",
+    "bfstm-2>-CSTM<": "bbfb2dc7871249816198dbf522422a61d2b434abd473bf041cd49cf1aab2c3e6",
+    "bfstm-2>-CSTM>": "2a419572f4d772dcf7bbcc7f85cf93ee23de9892782502470992c72827eff444",
+    "bfstm-2>-FSTP<": "f28eacda43b6543fceecdcb31472ab677ae7960643a7d2127f1237e23ca08eab",
+    "bfstm-2>-FSTP>": "8e4caaa144a83abd70a348ba35f01ff0140cff3f8068327a5240324689fc08bb",
+    "bfwav-FWAV<": "9425dbe0a1dbf743636ccf51f6f1468fe358e2f04cb821955a5d298d580cee9f",
+    "bfwav-FWAV>": "8491636695b232de4e5734bd2027d0d9553aab5dd864c2f2d8a908ec9fc8e8f3",
+    "bfwav-CWAV<": "2b8b7dca85110e94826e3a9e08f964cc3e5ee83554e2800fb3d523e852fef223",
+    "bfwav-CWAV>": "0a45a21626f723cc0bc51216773e3c1b1f969a98124bf704f8d643ba10635833",
+    "bars": "1e3b5e8a4d753bcb9b85bb6c4cd339d27801476cf22096bb9730de7ba35af09c",
+}
+
+CASES = samples()
+STM_CASES = [case for case in CASES if case[2] == "STMtoSTM"]
+
+@pytest.mark.parametrize("name, data, func, args", CASES, ids=[case[0] for case in CASES])
+def test_output_matches_original_converter(name, data, func, args):
+    module = bars if func == "convert_bars" else bcf_converter
+    out = getattr(module, func)(bytearray(data), *args)
+    assert hashlib.sha256(bytes(out)).hexdigest() == EXPECTED[name]
+
+@pytest.mark.parametrize("chunk_size", [6, 1024, 1 << 20])
+@pytest.mark.parametrize("name, data, func, args", STM_CASES, ids=[case[0] for case in STM_CASES])
+def test_stream_matches_in_memory(name, data, func, args, chunk_size):
+    _, dest, dest_bom = args
+    # Trailing bytes after the last block are kept too
+    data += b"\x07" * 5
+    out = io.BytesIO()
+    assert bcf_converter.conv_stream(io.BytesIO(data), out, dest, dest_bom, chunk_size) is True
+    assert out.getvalue() == bytes(bcf_converter.conv_file(bytearray(data), dest, dest_bom))
+
+def test_bars_tracks_are_windows_into_the_file():
+    _, data, _, _ = CASES[-1]
+    tracks, _ = bars.get_bars_tracks(bytearray(data))
+    assert list(tracks) == [f"t{i}" for i in range(40)]
+    for track in tracks.values():
+        assert bytes(track[:4]) == b"FWAV"
+
+def test_bars_growing_tracks_dont_overwrite_the_next_ones():
+    rng = random.Random(0xF57)
+    # WiiU FSTP tracks grow by 0x20 bytes when converted, running over the next track
+    tracks = [(f"t{i}", bytes(bcf_converter.STMtoSTM(bytearray(bfstm(rng, nsamples=300 + i)), "FSTM", "FSTP", ">")))
+              for i in range(3)]
+    data = make_bars(rng, tracks)
+
+    # Like the converter did before the tracks were windows: convert copies
+    # of every track, then write them at their offsets in order
+    source, offsets = bars.get_bars_tracks(bytearray(data))
+    expected = bytearray(data)
+    for name, track in source.items():
+        new_track = bcf_converter.conv_file(bytearray(track), "FSTP", "<")
+        assert len(new_track) == len(track) + 0x20
+        expected[offsets[name]:offsets[name] + len(new_track)] = new_track
+    expected = bars.convert_bars(expected, "<")
+
+    bars_file = bars.BarsFile(data)
+    for name in bars_file.names:
+        track = bars_file.tracks[name]
+        assert bytes(track) == bytes(source[name])
+        bars_file.replace_track(name, bcf_converter.conv_file(track, "FSTP", "<"))
+    assert bytes(bars_file.convert("<")) == bytes(expected)
@@ -0,0 +1,32 @@
+import pytest
+
+# Only checks pythonnet is there, importing clr would start the .NET runtime
+pytest.importorskip("pythonnet")
+
+from ubotw_converter.bfres_backend import get_bfres_backend
+
+@pytest.fixture(scope="module")
+def dotnet():
+    try:
+        return get_bfres_backend()
+    except Exception as err:
+        pytest.skip(f"BfresLibrary could not be loaded: {err}")
+
+def test_bfres_round_trip(dotnet):
+    res_file = dotnet.ResFile()
+    res_file.Name = "Round"
+
+    data = dotnet.save(res_file)
+    assert data[:4] == b"FRES"
+
+    loaded = dotnet.ResFile(dotnet.to_stream(bytes(data)))
+    assert loaded.Name == "Round"
+    # Saving what was loaded gives the same file back
+    assert dotnet.save(loaded) == data
+
+def test_from_stream_reads_closed_streams(dotnet):
+    stream = dotnet.MemoryStream()
+    stream.Write(dotnet.to_stream(b"closed").ToArray(), 0, 6)
+    stream.Close()
+
+    assert dotnet.from_stream(stream) == bytearray(b"closed")
@@ -0,0 +1,106 @@
+import random
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from ubotw_converter.bflim_convertor import bntx as BNTX
+from ubotw_converter.bflim_convertor import bntx_dds_injector
+
+# RGBA8 unorm, as bflim_extract reports it
+RGBA8 = 0x0b01
+IMAGE_SIZE = 0x200
+INFO_ADDR = 0x110
+NAME_ADDR = 0x1c0
+PTRS_ADDR = 0x1e0
+DATA_ADDR = 0x200
+
+def make_bntx(name="tex"):
+    # A little endian BNTX holding a single linear RGBA8 texture of IMAGE_SIZE bytes
+    f = bytearray(DATA_ADDR + IMAGE_SIZE)
+    BNTX.BNTXHeader('<').pack_into(f, 0, b'BNTX\0\0\0\0', 0x40000, 0xFEFF, 0xC, 0x40, 0x1b2, 0, 0, 0, len(f))
+    f[0x1b0:0x1b2] = struct.pack('<H', 4)
+    f[0x1b2:0x1b6] = b'file'
+    BNTX.TexContainer('<').pack_into(f, 0x20, b'NX  ', 1, 0x60, 0, 0, 0, 0, 0)
+    f[0x60:0x68] = struct.pack('<q', 0x100)
+    BNTX.BlockHeader('<').pack_into(f, 0x100, b'BRTI', 0, 0xa0)
+    BNTX.TextureInfo('<').pack_into(
+        f, INFO_ADDR,
+        0, 2, 1, 0, 1, 1, RGBA8, 0x20, 4, 4, 1, 1, 0, 0x10000, IMAGE_SIZE, 0x200,
+        0x02030405, 1, NAME_ADDR, 0, PTRS_ADDR, 0, 0, 0, 0, 0,
+    )
+    f[NAME_ADDR:NAME_ADDR + 2] = struct.pack('<H', len(name))
+    f[NAME_ADDR + 2:NAME_ADDR + 2 + len(name)] = name.encode('utf-8')
+    f[PTRS_ADDR:PTRS_ADDR + 8] = struct.pack('<q', DATA_ADDR)
+    f[DATA_ADDR:] = b'\xaa' * IMAGE_SIZE
+    return bytes(f)
+
+def make_flim(width, height):
+    return SimpleNamespace(
+        width=width, height=height, realSize=width * height * 4, compSel=[0, 1, 2, 3],
+        data=bytes(range(256)) * (width * height * 4 // 256 + 1), format=0x5, dds_format=RGBA8,
+    )
+
+@pytest.fixture
+def flims(monkeypatch):
+    # Stands in for bflim_extract, bflim bytes are "WxH"
+    def read_flim(inb):
+        width, height = map(int, inb.decode().split('x'))
+        return make_flim(width, height)
+
+    monkeypatch.setattr(bntx_dds_injector.bflim_extract, "readFLIM", read_flim)
+
+def test_inject_fitting_texture(flims):
+    bntx_file = BNTX.BntxFile(make_bntx())
+
+    failed = bntx_dds_injector.inject_flims(bntx_file, {"tex": b"4x4"})
+
+    assert failed == {}
+    # 4x4 RGBA8 with a 32 byte pitch, padded with zeros up to the old size
+    data = bntx_file.buffer[DATA_ADDR:]
+    assert data[:4] == bytes(range(4))
+    assert data[128:] == bytes(IMAGE_SIZE - 128)
+
+def test_inject_oversized_texture_leaves_file_unchanged(flims):
+    original = make_bntx()
+    bntx_file = BNTX.BntxFile(original)
+    tex = bntx_file.textures["tex"]
+    tex_state = dict(vars(tex))
+
+    failed = bntx_dds_injector.inject_flims(bntx_file, {"tex": b"64x64"})
+
+    assert isinstance(failed["tex"], ValueError)
+    assert bytes(bntx_file.buffer) == original
+    assert vars(tex) == tex_state
+
+def test_inject_tex_checks_size_before_writing():
+    original = make_bntx()
+    bntx_file = BNTX.BntxFile(original)
+    tex = bntx_file.textures["tex"]
+    tex.imageSize = IMAGE_SIZE * 2
+
+    with pytest.raises(ValueError):
+        bntx_file.injectTex(tex, IMAGE_SIZE, 1)
+    assert bytes(bntx_file.buffer) == original
+
+@pytest.mark.parametrize("seed", range(200))
+def test_swizzle_numpy_matches_swizzle(seed):
+    pytest.importorskip("numpy")
+    rng = random.Random(seed)
+    tileMode = rng.choice([0, 1])
+    # Uncompressed formats, and BCn with 4x4 blocks of 8 or 16 bytes
+    blkWidth, blkHeight, bpp = rng.choice([(1, 1, 1), (1, 1, 2), (1, 1, 4), (1, 1, 8), (1, 1, 16), (4, 4, 8), (4, 4, 16)])
+    width, height = rng.randint(1, 96), rng.randint(1, 96)
+    roundPitch = rng.choice([0, 1])
+    blockHeightLog2 = rng.randint(0, 5)
+    toSwizzle = rng.choice([0, 1])
+
+    # Big enough for either direction, then sometimes cut short
+    size = (BNTX.round_up(BNTX.DIV_ROUND_UP(width, blkWidth) * bpp, 64)
+            * BNTX.round_up(BNTX.DIV_ROUND_UP(height, blkHeight), 256))
+    if rng.random() < 0.3:
+        size = rng.randrange(size)
+    data = bytes(rng.getrandbits(8) for _ in range(size))
+
+    args = (width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, data, toSwizzle)
+    assert BNTX._swizzle_numpy(*args) == BNTX._swizzle(*args)
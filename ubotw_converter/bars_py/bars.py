@@ -22,7 +22,8 @@ def get_bars_tracks(bars):
 	Gets the embedded tracks of a bars file, alongside their respective
 	offsets, and return two dictionaries: one containing the tracks and 
 	another one containing each track's offset, each using the respective
-	track's name as keys.
+	track's name as keys. If bars is a memoryview, the tracks are windows
+	into it instead of copies.
 	"""
 
 	if bars[0x8:0xA] == b"\xFF\xFE":
@@ -35,8 +36,7 @@ def get_bars_tracks(bars):
 	pos: int = 0
 
 	# Create a structure for the header
-	header: Header = Header(bom)
-	header.data(bars, pos)
+	header = Header[bom].parse(bars, pos)
 
 	# Check for an invalid file
 	if header.magic != b"BARS":
@@ -47,8 +47,7 @@ def get_bars_tracks(bars):
 	pos += header.size + header.count * 4
 
 	# Create a structure for the track structure
-	track_struct: TRKStruct = TRKStruct(bom, header.count)
-	track_struct.data(bars, pos)
+	track_struct = TRKStruct[bom, header.count].parse(bars, pos)
 
 	tracks_data = []
 	track_names = []
@@ -60,8 +59,7 @@ def get_bars_tracks(bars):
 		pos = track_struct.offsets[i * 2] 
 
 		# Create a structure for the AMTA header
-		amta: AMTAHeader = AMTAHeader(bom)
-		amta.data(bars, pos)
+		amta = AMTAHeader[bom].parse(bars, pos)
 
 		if amta.magic != AMTA_HEADER:
 			print('Invalid AMTA Header!')
@@ -71,14 +69,12 @@ def get_bars_tracks(bars):
 		pos += amta.size
 
 		for j in MAGICS:
-			data: AMTASubHeader = AMTASubHeader(bom)
-			data.data(bars, pos)
+			data = AMTASubHeader[bom].parse(bars, pos)
 			pos += data.size
 			if j != b'STRG':
 				pos += data.length
 			else:	
-				data.data_ = bars[pos:pos + data.length]
-				track_names.append((data.data_).decode('utf-8').split('\0')[0])
+				track_names.append(bytes(bars[pos:pos + data.length]).decode('utf-8').split('\0')[0])
 
 	for i in range(header.count):
 		# Get the offset of our track
@@ -88,12 +84,9 @@ def get_bars_tracks(bars):
 			# The offset the file is telling us to jump to can't exist because the file's too small
 			continue
 
-		fwav: FWAVHeader = FWAVHeader(bom)
-		fwav.data(bars, pos)
+		fwav = FWAVHeader[bom].parse(bars, pos)
 
-		fwav.data_ = bars[pos:pos + fwav.size_]
-
-		tracks_data.append(fwav.data_)
+		tracks_data.append(bars[pos:pos + fwav.size_])
 		track_offsets.append(pos)
 
 	tracks = dict(zip(track_names, tracks_data))
@@ -101,11 +94,12 @@ def get_bars_tracks(bars):
 
 	return tracks, offsets
 
-def convert_bars(bars, dest_bom):
+def convert_bars(bars, dest_bom, in_place=False):
 
 	"""
 	Convert a bars file between endians, and return the converted
-	file
+	file. If in_place is set, bars must be a bytearray, and it is
+	converted without allocating a second buffer.
 	"""
 
 	if bars[0x8:0xA] == b"\xFF\xFE":
@@ -113,13 +107,16 @@ def convert_bars(bars, dest_bom):
 	else:
 		bom = '>'
 
-	# Create an output buffer the length of our file
-	output_buffer = bytearray(len(bars))
+	if in_place:
+		# Every field is read before being overwritten with the same size
+		output_buffer = bars
+	else:
+		# Create an output buffer the length of our file
+		output_buffer = bytearray(len(bars))
 	pos = 0
 
 	# Create a structure for the header
-	header = Header(bom)
-	header.data(bars, pos)
+	header = Header[bom].parse(bars, pos)
 
 	# Check for an invalid file
 	if header.magic != BARS_HEADER:
@@ -129,24 +126,22 @@ def convert_bars(bars, dest_bom):
 
 	# Write the header data to the output buffer
 	output_buffer[pos:pos + header.size] = bytes(
-		Header(dest_bom).pack("BARS".encode("utf-8").ljust(4, b'\0'), header.size_, header.endian, header.reserved, header.count)
+		Header[dest_bom].pack("BARS".encode("utf-8").ljust(4, b'\0'), header.size_, header.endian, header.reserved, header.count)
 	)
 
 	# Offset an amount of header.size
 	pos += header.size
 
 	# Copy the unknown data portion to the output_buffer
-	unknown = Unknown(bom, header.count)
-	unknown.data(bars, pos)
-	output_buffer[pos:pos + unknown.size] = Unknown(dest_bom, header.count).pack(*unknown.unknown)
+	unknown = Unknown[bom, header.count].parse(bars, pos)
+	output_buffer[pos:pos + unknown.size] = Unknown[dest_bom, header.count].pack(*unknown.unknown)
 	pos += unknown.size
 
 	# Create a structure for the track structure
-	track_struct = TRKStruct(bom, header.count)
-	track_struct.data(bars, pos)
+	track_struct = TRKStruct[bom, header.count].parse(bars, pos)
 
 	# Write the track structure data to the output buffer
-	output_buffer[pos:pos + track_struct.size] = TRKStruct(dest_bom, header.count).pack(*track_struct.offsets)
+	output_buffer[pos:pos + track_struct.size] = TRKStruct[dest_bom, header.count].pack(*track_struct.offsets)
 
 	track_names = []
 	
@@ -155,15 +150,14 @@ def convert_bars(bars, dest_bom):
 		pos = track_struct.offsets[i * 2] 
 
 		# Create a structure for the AMTA header
-		amta = AMTAHeader(bom)
-		amta.data(bars, pos)
+		amta = AMTAHeader[bom].parse(bars, pos)
 
 		if amta.magic != AMTA_HEADER:
 			raise RuntimeError(f"Track {t+1} has an invalid AMTA header")
 
 		# Write the AMTA data to the output buffer
 		output_buffer[pos:pos + amta.size] = bytes(
-			AMTAHeader(dest_bom).pack(amta.magic, amta.endian, amta.reserved, amta.length, amta.data_offset, amta.mark_offset, amta.ext_offset, amta.strg_offset)
+			AMTAHeader[dest_bom].pack(amta.magic, amta.endian, amta.reserved, amta.length, amta.data_offset, amta.mark_offset, amta.ext_offset, amta.strg_offset)
 		)
 
 		# Offset an amount of amta.size
@@ -171,25 +165,21 @@ def convert_bars(bars, dest_bom):
 
 		for j in MAGICS:
 
-			data = AMTASubHeader(bom)
-			data.data(bars, pos)
+			data = AMTASubHeader[bom].parse(bars, pos)
 				
-			output_buffer[pos:pos + data.size] = bytes(AMTASubHeader(dest_bom).pack(data.magic, data.length))
+			output_buffer[pos:pos + data.size] = bytes(AMTASubHeader[dest_bom].pack(data.magic, data.length))
 			pos += data.size
 
-			data.data_ = bars[pos:pos + data.length]
 			start = 0
 			if j == b'DATA':
 				output_buffer[pos:pos + 12] = bars[pos:pos + 12]
 				start = 12
 			
 			if bom != dest_bom and j != b'STRG':
-				for k in range(start, len(data.data_), 4):
-					output_buffer[pos + k:pos + k + 4] = bytes([
-						data.data_[k+3], data.data_[k+2], data.data_[k+1], data.data_[k] # Do an endian swap
-					])
+				# Do an endian swap of every word
+				byteswap_into(output_buffer, pos + start, bars, pos + start, data.length - start, (4,))
 			elif bom != dest_bom:
-				output_buffer[pos:pos + data.length] = data.data_
+				output_buffer[pos:pos + data.length] = bars[pos:pos + data.length]
 
 			pos += data.length
 		
@@ -202,16 +192,76 @@ def convert_bars(bars, dest_bom):
 		raise RuntimeError(f"Reached EOF, this file probably doesn't actually contain any FWAVs despite containing the offsets for them")
 
 	for i in range(header.count):
+		if in_place:
+			# The tracks are already there
+			break
+
 		pos = track_struct.offsets[i * 2 + 1] # Get track offset from list
 		if pos >= header.size_:
 			# The offset the file is telling us to jump to can't exist because the file's too small
 			continue
 
-		fwav = FWAVHeader(bom)
-		fwav.data(bars, pos)
+		fwav = FWAVHeader[bom].parse(bars, pos)
 
 		output_buffer[pos:pos + fwav.size_] = bars[pos:pos + fwav.size_]
 
 	output_buffer[0x4:0x8] = struct.pack(dest_bom + "I", len(output_buffer))
 
 	return output_buffer
+
+class BarsFile:
+
+	"""
+	A bars file held in a single buffer. Its tracks are memoryview
+	windows into that buffer until they're replaced. Replaced tracks are
+	written back when converting, in place unless one of them grew.
+	"""
+
+	def __init__(self, data):
+		self.buffer = data if isinstance(data, bytearray) else bytearray(data)
+		self._replaced = set()
+		self._load()
+
+	def _load(self):
+		self.view = memoryview(self.buffer)
+		bars_tracks = get_bars_tracks(self.view)
+		if not bars_tracks:
+			raise ValueError("Invalid BARS file!")
+		self.tracks, self.offsets = bars_tracks
+		self.sizes = {name: len(track) for name, track in self.tracks.items()}
+
+	@property
+	def names(self):
+		return list(self.tracks)
+
+	def replace_track(self, name, data):
+		# The buffer isn't touched yet, so the windows of the other tracks stay valid
+		self._replaced.add(name)
+		self.tracks[name] = data
+
+	def _write_tracks(self):
+		if not self._replaced:
+			return
+
+		if all(len(self.tracks[name]) <= self.sizes[name] for name in self._replaced):
+			# Every track fits in its old place, so nothing else gets overwritten
+			for name in self._replaced:
+				start = self.offsets[name]
+				self.view[start:start + len(self.tracks[name])] = self.tracks[name]
+		else:
+			# A bigger track runs over the ones after it. Write every track at its
+			# offset in order, from copies, with the last ones written winning. The
+			# file can grow, so this goes into a new buffer, as the current one
+			# can't be resized while there are windows into it
+			tracks = {name: bytes(track) for name, track in self.tracks.items()}
+			self.buffer = bytearray(self.buffer)
+			for name, track in tracks.items():
+				start = self.offsets[name]
+				self.buffer[start:start + len(track)] = track
+			self._load()
+		self._replaced = set()
+
+	def convert(self, dest_bom):
+		self._write_tracks()
+		convert_bars(self.buffer, dest_bom, in_place=True)
+		return self.buffer
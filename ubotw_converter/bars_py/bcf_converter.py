@@ -29,7 +29,7 @@ except ModuleNotFoundError:
 
 def conv_file(f, dest, dest_bom):
     # Convert embedded files, usually inside a bars file
-    magic = bytes_to_string(f[:4])
+    magic = bytes_to_string(bytes(f[:4]))
     if magic in supp_STM and dest in supp_STM:
         outputBuffer = STMtoSTM(f, magic, dest, dest_bom)
 
@@ -41,8 +41,79 @@ def conv_file(f, dest, dest_bom):
     
     return outputBuffer
 
-def STMtoSTM(f, magic, dest, dest_bom):
-    outputBuffer = bytearray(len(f))
+def conv_stream(inf, outf, dest, dest_bom, chunk_size=CHUNK_SIZE):
+    # Convert a stream file between two file objects, see STMtoSTM_stream
+    magic = bytes_to_string(inf.read(4))
+    inf.seek(-4, 1)
+    if magic in supp_STM and dest in supp_STM:
+        return STMtoSTM_stream(inf, outf, magic, dest, dest_bom, chunk_size)
+
+    print("\nUnsupported file format!")
+    return False
+
+def STMtoSTM_stream(inf, outf, magic, dest, dest_bom, chunk_size=CHUNK_SIZE):
+    """
+    Convert a stream file read from the file object inf, and write it to
+    the file object outf. Only the blocks before DATA are kept in memory,
+    while the samples are copied, or swapped, chunk_size bytes at a time.
+    Prefetch files and files with blocks after DATA are converted in memory.
+    """
+    head = bytearray(inf.read(AudioHeader['<'].size))
+    if head[4:6] not in [b'\xFF\xFE', b'\xFE\xFF']:
+        print("\nInvalid BOM!")
+        return False
+
+    bom = '<' if head[4:6] == b'\xFF\xFE' else '>'
+    header = AudioHeader[bom].parse(head)
+    head += inf.read(header.numBlocks * SizedRef[bom].size)
+    sized_refs = [SizedRef[bom].parse(head, header.size + 12 * i) for i in range(header.numBlocks)]
+    data_ref = next((ref for ref in sized_refs if ref.type_ in [0x4002, 0x4004]), None)
+
+    if dest == "FSTP" or data_ref is None or any(ref.offset > data_ref.offset for ref in sized_refs):
+        head += inf.read()
+        outputBuffer = STMtoSTM(head, magic, dest, dest_bom)
+        if outputBuffer is False:
+            return False
+
+        outf.write(outputBuffer)
+        return True
+
+    # Read everything up to the samples
+    head += inf.read(data_ref.offset + BLKHeader[bom].size - len(head))
+    samples = []
+    outputBuffer = STMtoSTM(head, magic, dest, dest_bom, stream_data=lambda *args: samples.append(args))
+    if outputBuffer is False:
+        return False
+
+    outf.write(outputBuffer)
+
+    chunk = bytearray(chunk_size)
+    chunk_view = memoryview(chunk)
+    for pos, length, widths in samples:
+        while length > 0:
+            size = inf.readinto(chunk_view[:min(chunk_size, length)])
+            if not size:
+                break
+
+            if widths:
+                byteswap_into(chunk, 0, chunk, 0, size, widths)
+
+            outf.write(chunk_view[:size])
+            length -= size
+
+    # Whatever comes after the DATA block isn't kept
+    while True:
+        size = inf.readinto(chunk)
+        if not size:
+            break
+
+        outf.write(bytes(size))
+
+    return True
+
+def STMtoSTM(f, magic, dest, dest_bom, stream_data=None):
+    # If stream_data is given, it's called with the position, length and field widths
+    # of the DATA samples instead of converting them, for the caller to stream them
     pos = 0
 
     if f[4:6] == b'\xFF\xFE':
@@ -62,8 +133,14 @@ def STMtoSTM(f, magic, dest, dest_bom):
         else:
             dest_bom = '<'
 
-    header = AudioHeader(bom)
-    header.data(f, pos)
+    if dest == "FSTP" and bom != dest_bom == '<':
+        # Leave room for the bigger Switch PDAT header, so the data never has to be moved
+        outputBuffer = bytearray(len(f) + PDAT_HEADER_GROWTH)
+
+    else:
+        outputBuffer = bytearray(len(f))
+
+    header = AudioHeader[bom].parse(f, pos)
 
     curr = magic
 
@@ -72,7 +149,7 @@ def STMtoSTM(f, magic, dest, dest_bom):
         dest_ver[dest] = header.version
 
     outputBuffer[pos:pos + header.size] = bytes(
-        AudioHeader(dest_bom).pack(to_bytes(dest, 4), header.size_, dest_ver[dest], header.fileSize, header.numBlocks,
+        AudioHeader[dest_bom].pack(to_bytes(dest, 4), header.size_, dest_ver[dest], header.fileSize, header.numBlocks,
                               header.reserved))
 
     outputBuffer[4:6] = (b'\xFE\xFF' if dest_bom == '>' else b'\xFF\xFE')
@@ -83,19 +160,15 @@ def STMtoSTM(f, magic, dest, dest_bom):
     sized_refs = {}
 
     for i in range(1, header.numBlocks + 1):
-        sized_refs[i] = Ref(bom)
-        sized_refs[i].data(f, pos + 12 * (i - 1))
+        sized_refs[i] = SizedRef[bom].parse(f, pos + 12 * (i - 1))
 
         if sized_refs[i].type_ in [0x4002, 0x4004]:
-            outputBuffer[pos + 12 * (i - 1):pos + 12 * (i - 1) + sized_refs[i].size] = bytes(
-                Ref(dest_bom).pack(dest_type[dest], sized_refs[i].offset))
+            outputBuffer[pos + 12 * (i - 1):pos + 12 * i] = SizedRef[dest_bom].pack(
+                dest_type[dest], sized_refs[i].offset, sized_refs[i].block_size)
 
         else:
-            outputBuffer[pos + 12 * (i - 1):pos + 12 * (i - 1) + sized_refs[i].size] = bytes(
-                Ref(dest_bom).pack(sized_refs[i].type_, sized_refs[i].offset))
-
-        sized_refs[i].block_size = struct.unpack(bom + "I", f[pos + 12 * (i - 1) + 8:pos + 12 * i])[0]
-        outputBuffer[pos + 12 * (i - 1) + 8:pos + 12 * i] = to_bytes(sized_refs[i].block_size, 4, dest_bom)
+            outputBuffer[pos + 12 * (i - 1):pos + 12 * i] = SizedRef[dest_bom].pack(
+                sized_refs[i].type_, sized_refs[i].offset, sized_refs[i].block_size)
 
     if sized_refs[1].type_ != 0x4000 or sized_refs[1].offset in [0, -1]:
         print("\nSomething went wrong!")
@@ -103,29 +176,25 @@ def STMtoSTM(f, magic, dest, dest_bom):
 
     pos = sized_refs[1].offset
 
-    info = BLKHeader(bom)
-    info.data(f, pos)
+    info = BLKHeader[bom].parse(f, pos)
 
-    outputBuffer[pos:pos + info.size] = bytes(BLKHeader(dest_bom).pack(info.magic, info.size_))
+    outputBuffer[pos:pos + info.size] = bytes(BLKHeader[dest_bom].pack(info.magic, info.size_))
     pos += info.size
 
-    stmInfo_ref = Ref(bom)
-    stmInfo_ref.data(f, pos)
+    stmInfo_ref = Ref[bom].parse(f, pos)
 
-    outputBuffer[pos:pos + stmInfo_ref.size] = bytes(Ref(dest_bom).pack(stmInfo_ref.type_, stmInfo_ref.offset))
+    outputBuffer[pos:pos + stmInfo_ref.size] = bytes(Ref[dest_bom].pack(stmInfo_ref.type_, stmInfo_ref.offset))
 
     if stmInfo_ref.type_ != 0x4100 or stmInfo_ref.offset in [0, -1]:
         print("\nSomething went wrong!")
         return False
 
-    stmInfo_ref.pos = pos
     pos += stmInfo_ref.size
 
-    trkInfoTable_ref = Ref(bom)
-    trkInfoTable_ref.data(f, pos)
+    trkInfoTable_ref = Ref[bom].parse(f, pos)
 
     outputBuffer[pos:pos + trkInfoTable_ref.size] = bytes(
-        Ref(dest_bom).pack(trkInfoTable_ref.type_, trkInfoTable_ref.offset))
+        Ref[dest_bom].pack(trkInfoTable_ref.type_, trkInfoTable_ref.offset))
 
     if trkInfoTable_ref.type_ not in [0x0101, 0]:
         print("\nSomething went wrong!")
@@ -133,37 +202,33 @@ def STMtoSTM(f, magic, dest, dest_bom):
 
     pos += trkInfoTable_ref.size
 
-    channelInfoTable_ref = Ref(bom)
-    channelInfoTable_ref.data(f, pos)
+    channelInfoTable_ref = Ref[bom].parse(f, pos)
 
     outputBuffer[pos:pos + channelInfoTable_ref.size] = bytes(
-        Ref(dest_bom).pack(channelInfoTable_ref.type_, channelInfoTable_ref.offset))
+        Ref[dest_bom].pack(channelInfoTable_ref.type_, channelInfoTable_ref.offset))
 
     if channelInfoTable_ref.type_ != 0x0101:
         print("\nSomething went wrong!")
         return False
 
     pos = stmInfo_ref.offset + stmInfo_ref.pos
-    stmInfo = STMInfo(bom)
-    stmInfo.data(f, pos)
+    stmInfo = STMInfo[bom].parse(f, pos)
 
     outputBuffer[pos:pos + stmInfo.size] = bytes(
-        STMInfo(dest_bom).pack(stmInfo.codec, stmInfo.loop_flag, stmInfo.ch_count, stmInfo.reg_count, stmInfo.sample, stmInfo.loop_start,
+        STMInfo[dest_bom].pack(stmInfo.codec, stmInfo.loop_flag, stmInfo.ch_count, stmInfo.reg_count, stmInfo.sample, stmInfo.loop_start,
                             stmInfo.sample_count, stmInfo.sampleBlk_count, stmInfo.sampleBlk_size,
                             stmInfo.sampleBlk_sampleCount, stmInfo.lSampleBlk_size, stmInfo.lSampleBlk_sampleCount,
                             stmInfo.lSampleBlk_padSize, stmInfo.seek_size, stmInfo.SISC))
     pos += stmInfo.size
 
-    sampleData_ref = Ref(bom)
-    sampleData_ref.data(f, pos)
+    sampleData_ref = Ref[bom].parse(f, pos)
 
-    outputBuffer[pos:pos + sampleData_ref.size] = bytes(Ref(dest_bom).pack(sampleData_ref.type_, sampleData_ref.offset))
+    outputBuffer[pos:pos + sampleData_ref.size] = bytes(Ref[dest_bom].pack(sampleData_ref.type_, sampleData_ref.offset))
     pos += sampleData_ref.size
 
-    regInfo = REGNInfo(bom)
-    regInfo.data(f, pos)
+    regInfo = REGNInfo[bom].parse(f, pos)
 
-    outputBuffer[pos:pos + regInfo.size] = bytes(REGNInfo(dest_bom).pack(regInfo.reg_size, regInfo.reg_flag, regInfo.reg_offset, regInfo.loop_st, regInfo.loop_ed, regInfo.secret))
+    outputBuffer[pos:pos + regInfo.size] = bytes(REGNInfo[dest_bom].pack(regInfo.reg_size, regInfo.reg_flag, regInfo.reg_offset, regInfo.loop_st, regInfo.loop_ed, regInfo.secret))
     pos += regInfo.size
 
     trkInfoTable = {}
@@ -177,26 +242,23 @@ def STMtoSTM(f, magic, dest, dest_bom):
 
         for i in range(1, count + 1):
             pos = trkInfoTable_ref.offset + stmInfo_ref.pos + 4
-            trkInfoTable[i] = Ref(bom)
-            trkInfoTable[i].data(f, pos + 8 * (i - 1))
+            trkInfoTable[i] = Ref[bom].parse(f, pos + 8 * (i - 1))
 
             outputBuffer[pos + 8 * (i - 1):pos + 8 * (i - 1) + trkInfoTable[i].size] = bytes(
-                Ref(dest_bom).pack(trkInfoTable[i].type_, trkInfoTable[i].offset))
+                Ref[dest_bom].pack(trkInfoTable[i].type_, trkInfoTable[i].offset))
 
             if trkInfoTable[i].offset not in [0, -1]:
                 pos = trkInfoTable[i].offset + pos - 4
-                trkInfo[i] = TRKInfo(bom)
-                trkInfo[i].data(f, pos)
+                trkInfo[i] = TRKInfo[bom].parse(f, pos)
 
                 outputBuffer[pos:pos + trkInfo[i].size] = bytes(
-                    TRKInfo(dest_bom).pack(trkInfo[i].volume, trkInfo[i].pan, trkInfo[i].unk))
+                    TRKInfo[dest_bom].pack(trkInfo[i].volume, trkInfo[i].pan, trkInfo[i].unk))
 
                 pos += trkInfo[i].size
-                channelIndexByteTable_ref = Ref(bom)
-                channelIndexByteTable_ref.data(f, pos)
+                channelIndexByteTable_ref = Ref[bom].parse(f, pos)
 
                 outputBuffer[pos:pos + channelIndexByteTable_ref.size] = bytes(
-                    Ref(dest_bom).pack(channelIndexByteTable_ref.type_, channelIndexByteTable_ref.offset))
+                    Ref[dest_bom].pack(channelIndexByteTable_ref.type_, channelIndexByteTable_ref.offset))
 
                 if channelIndexByteTable_ref.offset not in [0, -1]:
                     pos = channelIndexByteTable_ref.offset + pos - trkInfo[i].size
@@ -217,19 +279,17 @@ def STMtoSTM(f, magic, dest, dest_bom):
 
     for i in range(1, count + 1):
         pos = channelInfoTable_ref.offset + stmInfo_ref.pos + 4
-        channelInfoTable[i] = Ref(bom)
-        channelInfoTable[i].data(f, pos + 8 * (i - 1))
+        channelInfoTable[i] = Ref[bom].parse(f, pos + 8 * (i - 1))
 
         outputBuffer[pos + 8 * (i - 1):pos + 8 * (i - 1) + channelInfoTable[i].size] = bytes(
-            Ref(dest_bom).pack(channelInfoTable[i].type_, channelInfoTable[i].offset))
+            Ref[dest_bom].pack(channelInfoTable[i].type_, channelInfoTable[i].offset))
 
         if channelInfoTable[i].offset not in [0, -1]:
             pos = channelInfoTable[i].offset + pos - 4
-            ADPCMInfo_ref[i] = Ref(bom)
-            ADPCMInfo_ref[i].data(f, pos)
+            ADPCMInfo_ref[i] = Ref[bom].parse(f, pos)
 
             outputBuffer[pos:pos + ADPCMInfo_ref[i].size] = bytes(
-                Ref(dest_bom).pack(ADPCMInfo_ref[i].type_, ADPCMInfo_ref[i].offset))
+                Ref[dest_bom].pack(ADPCMInfo_ref[i].type_, ADPCMInfo_ref[i].offset))
 
             if ADPCMInfo_ref[i].offset not in [0, -1]:
                 pos = ADPCMInfo_ref[i].offset + pos
@@ -239,36 +299,32 @@ def STMtoSTM(f, magic, dest, dest_bom):
                         outputBuffer[pos + 2 * (i - 1):pos + 2 * (i - 1) + 2] = to_bytes(param[i], 2, dest_bom)
 
                     pos += 32
-                    context = DSPContext(bom)
-                    context.data(f, pos)
+                    context = DSPContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + context.size] = bytes(
-                        DSPContext(dest_bom).pack(context.predictor_scale, context.preSample, context.preSample2))
+                        DSPContext[dest_bom].pack(context.predictor_scale, context.preSample, context.preSample2))
                         
                     pos += context.size
-                    loopContext = DSPContext(bom)
-                    loopContext.data(f, pos)
+                    loopContext = DSPContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + loopContext.size] = bytes(
-                        DSPContext(dest_bom).pack(loopContext.predictor_scale, loopContext.preSample,
+                        DSPContext[dest_bom].pack(loopContext.predictor_scale, loopContext.preSample,
                                                   loopContext.preSample2))
 
                     pos += loopContext.size
                     pos += 2
 
                 elif ADPCMInfo_ref[i].type_ == 0x0301:
-                    context = IMAContext(bom)
-                    context.data(f, pos)
+                    context = IMAContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + context.size] = bytes(
-                        IMAContext(dest_bom).pack(context.data_, context.tableIndex))
+                        IMAContext[dest_bom].pack(context.data_, context.tableIndex))
 
                     pos += context.size
-                    loopContext = IMAContext(bom)
-                    loopContext.data(f, pos)
+                    loopContext = IMAContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + loopContext.size] = bytes(
-                        IMAContext(dest_bom).pack(loopContext.data_, loopContext.tableIndex))
+                        IMAContext[dest_bom].pack(loopContext.data_, loopContext.tableIndex))
 
                     pos += loopContext.size
 
@@ -278,69 +334,46 @@ def STMtoSTM(f, magic, dest, dest_bom):
         if sized_refs[i].offset not in [0, -1]:
             if sized_refs[i].type_ == 0x4001:
                 pos = sized_refs[i].offset
-                seek = BLKHeader(bom)
-                seek.data(f, pos)
-                outputBuffer[pos:pos + seek.size] = bytes(BLKHeader(dest_bom).pack(seek.magic, seek.size_))
+                seek = BLKHeader[bom].parse(f, pos)
+                outputBuffer[pos:pos + seek.size] = bytes(BLKHeader[dest_bom].pack(seek.magic, seek.size_))
                 pos += seek.size
-                seek.data_ = f[pos:pos + seek.size_ - 8]
-
                 if curr[:-1] == dest[:-1]:
-                    for i in range(0, len(seek.data_), 2):
-                        outputBuffer[pos + i:pos + i + 2] = bytes([
-                            seek.data_[i+1], seek.data_[i],
-                        ])
+                    byteswap_into(outputBuffer, pos, f, pos, seek.size_ - 8, (2,))
 
                 else:
-                    outputBuffer[pos:pos + seek.size_ - 8] = seek.data_
+                    outputBuffer[pos:pos + seek.size_ - 8] = f[pos:pos + seek.size_ - 8]
                         
             elif sized_refs[i].type_ == 0x4003:
                 pos = sized_refs[i].offset
-                regn = BLKHeader(bom)
-                regn.data(f, pos)
-                outputBuffer[pos:pos + regn.size] = bytes(BLKHeader(dest_bom).pack(regn.magic, regn.size_))
+                regn = BLKHeader[bom].parse(f, pos)
+                outputBuffer[pos:pos + regn.size] = bytes(BLKHeader[dest_bom].pack(regn.magic, regn.size_))
                 pos += 32
-                regn.data_ = f[pos:pos + regn.size_ - 32]
-
                 if bom != dest_bom:
-                    for i in range(0, len(regn.data_), regInfo.reg_size):
-                        j = 0
-                        step = 2
-                        while j < regInfo.reg_size:
-                            if j < 8:
-                                step = 4
-                                outputBuffer[pos + j:pos + j + 4] = bytes([
-                                    regn.data_[i+j+3], regn.data_[i+j+2], regn.data_[i+j+1], regn.data_[i+j],
-                                ])
-                            else:
-                                step = 2
-                                outputBuffer[pos + j:pos + j + 2] = bytes([
-                                    regn.data_[i+j+1], regn.data_[i+j],
-                                ])
-                            
-                            j += step
-                        pos += regInfo.reg_size
+                    # Each region starts with two words, followed by halfwords
+                    layout = (4, 4) + (2,) * ((regInfo.reg_size - 8) // 2)
+                    byteswap_into(outputBuffer, pos, f, pos, regn.size_ - 32, layout)
 
                 else:
-                    outputBuffer[pos:pos + regn.size_ - 8] = regn.data_
+                    outputBuffer[pos:pos + regn.size_ - 8] = f[pos:pos + regn.size_ - 32]
 
             elif sized_refs[i].type_ in [0x4002, 0x4004]:
                 pos = sized_refs[i].offset
-                data = BLKHeader(bom)
-                data.data(f, pos)
-                outputBuffer[pos:pos + data.size] = bytes(BLKHeader(dest_bom).pack(dest_dataHead[dest], data.size_))
+                data = BLKHeader[bom].parse(f, pos)
+                outputBuffer[pos:pos + data.size] = bytes(BLKHeader[dest_bom].pack(dest_dataHead[dest], data.size_))
                 pos += data.size
-                data.data_ = f[pos:pos + data.size_ - 8]
+                if bom != dest_bom and dest == "FSTP":
+                    # Copies the data to where it goes in the new PDAT block
+                    fix_bfstp(outputBuffer, f, pos, dest_bom, sized_refs, (2,) if stmInfo.codec == 1 else None)
+
+                elif stream_data is not None:
+                    stream_data(pos, data.size_ - 8, (2,) if bom != dest_bom and stmInfo.codec == 1 else None)
 
-                if bom != dest_bom and stmInfo.codec == 1:
-                    for i in range(0, len(data.data_), 2):
-                        outputBuffer[pos + i:pos + i + 2] = bytes([
-                            data.data_[i+1], data.data_[i],
-                        ])
+                elif bom != dest_bom and stmInfo.codec == 1:
+                    # Swap every PCM16 sample
+                    byteswap_into(outputBuffer, pos, f, pos, data.size_ - 8, (2,))
 
                 else:
-                    outputBuffer[pos:pos + data.size_ - 8] = data.data_
-                if bom != dest_bom and dest == "FSTP":
-                    fix_bfstp(outputBuffer, pos, dest_bom, sized_refs)
+                    outputBuffer[pos:pos + data.size_ - 8] = f[pos:pos + data.size_ - 8]
 
     return outputBuffer
 
@@ -365,15 +398,14 @@ def WAVtoWAV(f, magic, dest, dest_bom):
         else:
             dest_bom = '<'
 
-    header = AudioHeader(bom)
-    header.data(f, pos)
+    header = AudioHeader[bom].parse(f, pos)
 
     dest_ver = {"FWAV": 0x10100, "CWAV": 0x2010000}
     if magic == dest:
         dest_ver[dest] = header.version
 
     outputBuffer[pos:pos + header.size] = bytes(
-        AudioHeader(dest_bom).pack(to_bytes(dest, 4), header.size_, dest_ver[dest], header.fileSize, header.numBlocks,
+        AudioHeader[dest_bom].pack(to_bytes(dest, 4), header.size_, dest_ver[dest], header.fileSize, header.numBlocks,
                               header.reserved))
 
     outputBuffer[4:6] = (b'\xFE\xFF' if dest_bom == '>' else b'\xFF\xFE')
@@ -382,15 +414,10 @@ def WAVtoWAV(f, magic, dest, dest_bom):
     sized_refs = {}
 
     for i in range(1, header.numBlocks + 1):
-        sized_refs[i] = Ref(bom)
-        sized_refs[i].data(f, pos + 12 * (i - 1))
+        sized_refs[i] = SizedRef[bom].parse(f, pos + 12 * (i - 1))
 
-        outputBuffer[pos + 12 * (i - 1):pos + 12 * (i - 1) + sized_refs[i].size] = bytes(
-            Ref(dest_bom).pack(sized_refs[i].type_, sized_refs[i].offset))
-
-        sized_refs[i].block_size = struct.unpack(bom + "I", f[pos + 12 * (i - 1) + 8:pos + 12 * i])[0]
-
-        outputBuffer[pos + 12 * (i - 1) + 8:pos + 12 * i] = to_bytes(sized_refs[i].block_size, 4, dest_bom)
+        outputBuffer[pos + 12 * (i - 1):pos + 12 * i] = SizedRef[dest_bom].pack(
+            sized_refs[i].type_, sized_refs[i].offset, sized_refs[i].block_size)
 
     if sized_refs[1].type_ != 0x7000 or sized_refs[1].offset in [0, -1]:
         print("\nSomething went wrong")
@@ -398,19 +425,16 @@ def WAVtoWAV(f, magic, dest, dest_bom):
 
     pos = sized_refs[1].offset
 
-    info = BLKHeader(bom)
-    info.data(f, pos)
-    info.pos = pos
+    info = BLKHeader[bom].parse(f, pos)
 
-    outputBuffer[pos:pos + info.size] = bytes(BLKHeader(dest_bom).pack(info.magic, info.size_))
+    outputBuffer[pos:pos + info.size] = bytes(BLKHeader[dest_bom].pack(info.magic, info.size_))
 
     pos += info.size
 
-    wavInfo = WAVInfo(bom)
-    wavInfo.data(f, pos)
+    wavInfo = WAVInfo[bom].parse(f, pos)
 
     outputBuffer[pos:pos + wavInfo.size] = bytes(
-        WAVInfo(dest_bom).pack(wavInfo.codec, wavInfo.loop_flag, wavInfo.sample,
+        WAVInfo[dest_bom].pack(wavInfo.codec, wavInfo.loop_flag, wavInfo.sample,
                                wavInfo.loop_start, wavInfo.loop_end, wavInfo.reserved))
 
     pos += wavInfo.size
@@ -426,26 +450,23 @@ def WAVtoWAV(f, magic, dest, dest_bom):
 
     for i in range(1, count + 1):
         pos = countPos + 4
-        channelInfoTable[i] = Ref(bom)
-        channelInfoTable[i].data(f, pos + 8 * (i - 1))
+        channelInfoTable[i] = Ref[bom].parse(f, pos + 8 * (i - 1))
 
         outputBuffer[pos + 8 * (i - 1):pos + 8 * (i - 1) + channelInfoTable[i].size] = bytes(
-            Ref(dest_bom).pack(channelInfoTable[i].type_, channelInfoTable[i].offset))
+            Ref[dest_bom].pack(channelInfoTable[i].type_, channelInfoTable[i].offset))
 
         if channelInfoTable[i].offset not in [0, -1]:
             pos = channelInfoTable[i].offset + countPos
-            sampleData_ref[i] = Ref(bom)
-            sampleData_ref[i].data(f, pos)
+            sampleData_ref[i] = Ref[bom].parse(f, pos)
 
             outputBuffer[pos:pos + sampleData_ref[i].size] = bytes(
-                Ref(dest_bom).pack(sampleData_ref[i].type_, sampleData_ref[i].offset))
+                Ref[dest_bom].pack(sampleData_ref[i].type_, sampleData_ref[i].offset))
 
             pos += 8
-            ADPCMInfo_ref[i] = Ref(bom)
-            ADPCMInfo_ref[i].data(f, pos)
+            ADPCMInfo_ref[i] = Ref[bom].parse(f, pos)
 
             outputBuffer[pos:pos + ADPCMInfo_ref[i].size] = bytes(
-                Ref(dest_bom).pack(ADPCMInfo_ref[i].type_, ADPCMInfo_ref[i].offset))
+                Ref[dest_bom].pack(ADPCMInfo_ref[i].type_, ADPCMInfo_ref[i].offset))
 
             if ADPCMInfo_ref[i].offset not in [0, -1]:
                 pos = ADPCMInfo_ref[i].offset + pos - 8
@@ -456,36 +477,32 @@ def WAVtoWAV(f, magic, dest, dest_bom):
                         outputBuffer[pos + 2 * (i - 1):pos + 2 * (i - 1) + 2] = to_bytes(param[i], 2, dest_bom)
 
                     pos += 32
-                    context = DSPContext(bom)
-                    context.data(f, pos)
+                    context = DSPContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + context.size] = bytes(
-                        DSPContext(dest_bom).pack(context.predictor_scale, context.preSample, context.preSample2))
+                        DSPContext[dest_bom].pack(context.predictor_scale, context.preSample, context.preSample2))
 
                     pos += context.size
-                    loopContext = DSPContext(bom)
-                    loopContext.data(f, pos)
+                    loopContext = DSPContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + loopContext.size] = bytes(
-                        DSPContext(dest_bom).pack(loopContext.predictor_scale, loopContext.preSample,
+                        DSPContext[dest_bom].pack(loopContext.predictor_scale, loopContext.preSample,
                                                   loopContext.preSample2))
 
                     pos += loopContext.size
                     pos += 2
 
                 elif ADPCMInfo_ref[i].type_ == 0x0301:
-                    context = IMAContext(bom)
-                    context.data(f, pos)
+                    context = IMAContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + context.size] = bytes(
-                        IMAContext(dest_bom).pack(context.data_, context.tableIndex))
+                        IMAContext[dest_bom].pack(context.data_, context.tableIndex))
 
                     pos += context.size
-                    loopContext = IMAContext(bom)
-                    loopContext.data(f, pos)
+                    loopContext = IMAContext[bom].parse(f, pos)
 
                     outputBuffer[pos:pos + loopContext.size] = bytes(
-                        IMAContext(dest_bom).pack(loopContext.data_, loopContext.tableIndex))
+                        IMAContext[dest_bom].pack(loopContext.data_, loopContext.tableIndex))
 
                     pos += loopContext.size
 
@@ -493,19 +510,14 @@ def WAVtoWAV(f, magic, dest, dest_bom):
         if sized_refs[i].offset not in [0, -1]:
             if sized_refs[i].type_ == 0x7001:
                 pos = sized_refs[i].offset
-                data = BLKHeader(bom)
-                data.data(f, pos)
-                outputBuffer[pos:pos + data.size] = bytes(BLKHeader(dest_bom).pack(data.magic, data.size_))
+                data = BLKHeader[bom].parse(f, pos)
+                outputBuffer[pos:pos + data.size] = bytes(BLKHeader[dest_bom].pack(data.magic, data.size_))
                 pos += data.size
-                data.data_ = f[pos:pos + data.size_ - 8]
-
                 if bom != dest_bom and wavInfo.codec == 1:
-                    for i in range(0, len(data.data_), 2):
-                        outputBuffer[pos + i:pos + i + 2] = bytes([
-                            data.data_[i+1], data.data_[i],
-                        ])
+                    # Swap every PCM16 sample
+                    byteswap_into(outputBuffer, pos, f, pos, data.size_ - 8, (2,))
 
                 else:
-                    outputBuffer[pos:pos + data.size_ - 8] = data.data_
+                    outputBuffer[pos:pos + data.size_ - 8] = f[pos:pos + data.size_ - 8]
 
     return outputBuffer
\ No newline at end of file
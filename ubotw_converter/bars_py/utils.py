@@ -2,171 +2,119 @@
 #!/usr/bin/python3
 
 import struct
-
-class Header(struct.Struct):
-	# Bars Header
-	def __init__(self, bom):
-		super().__init__(bom + "4sI2HI")
-
-	def data(self, data, pos):
-		(self.magic,
-		 self.size_,
-		 self.endian,
-		 self.reserved,
-		 self.count) = self.unpack_from(data, pos)
-
-class AudioHeader(struct.Struct):
-    def __init__(self, bom):
-        super().__init__(bom + '4s2xH2I2H')
-
-    def data(self, data, pos):
-        (self.magic,
-         self.size_,
-         self.version,
-         self.fileSize,
-         self.numBlocks,
-         self.reserved) = self.unpack_from(data, pos)
-
-class TRKStruct(struct.Struct):
-	def __init__(self, bom, count):
-		super().__init__(f"{bom}{count*2}I")
-	
-	def data(self, data, pos):
-		self.offsets = self.unpack_from(data, pos)
-
-class Unknown(struct.Struct):
-	# Unknown bytes, but I'm guessing track info
-	def __init__(self, bom, count):
-		super().__init__(f'{bom}{count}I')
-
-	def data(self, data, pos):
-		self.unknown = self.unpack_from(data, pos)
-
-class AMTAHeader(struct.Struct):
-	# Amta Header
-	def __init__(self, bom):
-		super().__init__(bom + "4s2H5I")
-
-	def data(self, data, pos):
-		(self.magic,
-		 self.endian,
-		 self.reserved,
-		 self.length,
-		 self.data_offset,
-		 self.mark_offset,
-		 self.ext_offset,
-		 self.strg_offset) = self.unpack_from(data, pos)
-
-class BLKHeader(struct.Struct):
-	def __init__(self, bom):
-		super().__init__(bom + "4sI")
-
-	def data(self, data, pos):
-		(self.magic,
-		 self.size_) = self.unpack_from(data, pos)
-
-class AMTASubHeader(struct.Struct):
-	# Header for DATA, MARK, EXT_ and STRG sections
-	def __init__(self, bom):
-		super().__init__(bom + "4sI")
-
-	def data(self, data, pos):
-		(self.magic,
-		 self.length) = self.unpack_from(data, pos)
-
-class FWAVHeader(struct.Struct):
-	def __init__(self, bom):
-		super().__init__(bom + "4s8xI8x2I32x")
-
-	def data(self, data, pos):
-		(self.magic,
-		 self.size_,
-		 self.info_offset,
-		 self.data_offset) = self.unpack_from(data, pos)
-
-class STMInfo(struct.Struct):  # Stream Info
-    def __init__(self, bom):
-        super().__init__(bom + '4B11I')
-
-    def data(self, data, pos):
-        (self.codec,
-         self.loop_flag,
-         self.ch_count,
-         self.reg_count,
-         self.sample,
-         self.loop_start,
-         self.sample_count,
-         self.sampleBlk_count,
-         self.sampleBlk_size,
-         self.sampleBlk_sampleCount,
-         self.lSampleBlk_size,
-         self.lSampleBlk_sampleCount,
-         self.lSampleBlk_padSize,
-         self.seek_size,
-         self.SISC) = self.unpack_from(data, pos)
-
-class WAVInfo(struct.Struct):  # Wave Info
-    def __init__(self, bom):
-        super().__init__(bom + '2B2x4I')
-
-    def data(self, data, pos):
-        (self.codec,
-         self.loop_flag,
-         self.sample,
-         self.loop_start,
-         self.loop_end,
-         self.reserved) = self.unpack_from(data, pos)
-
-class TRKInfo(struct.Struct):  # Track Info
-    def __init__(self, bom):
-        super().__init__(bom + '2BH')
-
-    def data(self, data, pos):
-        (self.volume,
-         self.pan,
-         self.unk) = self.unpack_from(data, pos)
-
-
-class DSPContext(struct.Struct):
-	# Context table for DSP formats
-    def __init__(self, bom):
-        super().__init__(bom + '3H')
-
-    def data(self, data, pos):
-        (self.predictor_scale,
-         self.preSample,
-         self.preSample2) = self.unpack_from(data, pos)
-
-
-class IMAContext(struct.Struct): 
-	# Context table for IMA formats
-    def __init__(self, bom):
-        super().__init__(bom + '2H')
-
-    def data(self, data, pos):
-        (self.data_,
-         self.tableIndex) = self.unpack_from(data, pos)
-
-
-class Ref(struct.Struct):  # Reference
-    def __init__(self, bom):
-        super().__init__(bom + 'H2xi')
-
-    def data(self, data, pos):
-        (self.type_,
-         self.offset) = self.unpack_from(data, pos)
-
-class REGNInfo(struct.Struct):
-    def __init__(self, bom):
-        super().__init__(bom + 'H2xH2xi3I')
-    
-    def data(self, data, pos):
-        (self.reg_size,
-         self.reg_flag,
-         self.reg_offset,
-         self.loop_st,
-         self.loop_ed,
-         self.secret) = self.unpack_from(data, pos)
+from array import array
+
+class Record:
+	# Parsed fields of a layout, plus where they were read from
+	__slots__ = ("pos", "size")
+
+	def __repr__(self):
+		fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+		return f"{type(self).__name__}(pos={self.pos}, {fields})"
+
+class Layout:
+	# A precompiled struct for one byte order
+	__slots__ = ("struct", "size", "fields", "record", "table", "pack", "unpack_from")
+
+	def __init__(self, fmt, fields, record, table=False):
+		self.struct = struct.Struct(fmt)
+		self.size = self.struct.size
+		self.fields = fields
+		self.record = record
+		self.table = table
+		self.pack = self.struct.pack
+		self.unpack_from = self.struct.unpack_from
+
+	def parse(self, data, pos=0):
+		record = self.record()
+		record.pos = pos
+		record.size = self.size
+		values = self.unpack_from(data, pos)
+		if self.table:
+			# Count-parameterized layouts keep all of their values in one field
+			setattr(record, self.fields[0], values)
+		else:
+			for name, value in zip(self.fields, values):
+				setattr(record, name, value)
+		return record
+
+class LayoutFamily:
+
+	"""
+	The little and big endian layouts of a structure, built once and
+	looked up with family[bom]. If repeat is set, the layout is a table
+	of count entries of fmt, looked up with family[bom, count].
+	"""
+
+	def __init__(self, name, fmt, fields, repeat=0):
+		self.name = name
+		self.fmt = fmt
+		self.fields = fields
+		self.repeat = repeat
+		self.record = type(name, (Record,), {"__slots__": fields})
+		self._layouts = {}
+		if not repeat:
+			for bom in "<>":
+				self._layouts[bom] = Layout(bom + fmt, fields, self.record)
+
+	def __getitem__(self, key):
+		try:
+			return self._layouts[key]
+		except KeyError:
+			if not self.repeat:
+				raise
+		bom, count = key
+		layout = self._layouts[key] = Layout(f"{bom}{count * self.repeat}{self.fmt}", self.fields, self.record, True)
+		return layout
+
+# Bars Header
+Header = LayoutFamily("Header", "4sI2HI", ("magic", "size_", "endian", "reserved", "count"))
+
+AudioHeader = LayoutFamily("AudioHeader", "4s2xH2I2H", ("magic", "size_", "version", "fileSize", "numBlocks", "reserved"))
+
+TRKStruct = LayoutFamily("TRKStruct", "I", ("offsets",), repeat=2)
+
+# Unknown bytes, but I'm guessing track info
+Unknown = LayoutFamily("Unknown", "I", ("unknown",), repeat=1)
+
+# Amta Header
+AMTAHeader = LayoutFamily("AMTAHeader", "4s2H5I", (
+	"magic", "endian", "reserved", "length", "data_offset", "mark_offset", "ext_offset", "strg_offset"
+))
+
+BLKHeader = LayoutFamily("BLKHeader", "4sI", ("magic", "size_"))
+
+# Header for DATA, MARK, EXT_ and STRG sections
+AMTASubHeader = LayoutFamily("AMTASubHeader", "4sI", ("magic", "length"))
+
+FWAVHeader = LayoutFamily("FWAVHeader", "4s8xI8x2I32x", ("magic", "size_", "info_offset", "data_offset"))
+
+# Stream Info
+STMInfo = LayoutFamily("STMInfo", "4B11I", (
+	"codec", "loop_flag", "ch_count", "reg_count", "sample", "loop_start", "sample_count",
+	"sampleBlk_count", "sampleBlk_size", "sampleBlk_sampleCount", "lSampleBlk_size",
+	"lSampleBlk_sampleCount", "lSampleBlk_padSize", "seek_size", "SISC"
+))
+
+# Wave Info
+WAVInfo = LayoutFamily("WAVInfo", "2B2x4I", ("codec", "loop_flag", "sample", "loop_start", "loop_end", "reserved"))
+
+# Track Info
+TRKInfo = LayoutFamily("TRKInfo", "2BH", ("volume", "pan", "unk"))
+
+# Context table for DSP formats
+DSPContext = LayoutFamily("DSPContext", "3H", ("predictor_scale", "preSample", "preSample2"))
+
+# Context table for IMA formats
+IMAContext = LayoutFamily("IMAContext", "2H", ("data_", "tableIndex"))
+
+# Reference
+Ref = LayoutFamily("Ref", "H2xi", ("type_", "offset"))
+
+# Reference followed by the size of the block it points to
+SizedRef = LayoutFamily("SizedRef", "H2xiI", ("type_", "offset", "block_size"))
+
+REGNInfo = LayoutFamily("REGNInfo", "H2xH2xi3I", ("reg_size", "reg_flag", "reg_offset", "loop_st", "loop_ed", "secret"))
 
 def bytes_to_string(data):
     end = data.find(b'\0')
@@ -188,28 +136,83 @@ def to_bytes(inp, length=1, bom='>'):
 def align(x, y):
     return ((x - 1) | (y - 1)) + 1
 
-def fix_bfstp(outputBuffer: bytearray, pos: int, dest_bom: str, sized_refs):
+# Array typecode for each field width, used for bulk byte swapping
+SWAP_TYPECODES = {array(code).itemsize: code for code in "LIH"}
+
+def byteswap_into(dst, dst_pos, src, src_pos, length, widths=(4,)):
+    """
+    Copy length bytes of src to dst, reversing the byte order of every
+    field. widths is the layout of one record, repeated over the whole
+    section, and a trailing partial record is copied as is.
+    """
+    length = max(0, min(length, len(src) - src_pos))
+    stride = sum(widths)
+    if stride == 0:
+        raise ValueError("Invalid record layout")
+
+    end = (length // stride) * stride
+    src_v = memoryview(src)[src_pos:src_pos + end]
+
+    if len(widths) == 1 and widths[0] in SWAP_TYPECODES:
+        # Every field has the same size, let array do the swapping
+        fields = array(SWAP_TYPECODES[widths[0]])
+        fields.frombytes(src_v)
+        fields.byteswap()
+        dst[dst_pos:dst_pos + end] = fields
+
+    elif end:
+        # Mixed layout, move each byte of the record with a strided copy
+        if src is dst:
+            src_v = bytes(src_v)
+        dst_v = memoryview(dst)[dst_pos:dst_pos + end]
+        field = 0
+        for width in widths:
+            for k in range(width):
+                dst_v[field + k::stride] = src_v[field + width - 1 - k::stride]
+            field += width
+
+    dst[dst_pos + end:dst_pos + length] = src[src_pos + end:src_pos + length]
+
+# Size the Switch PDAT header adds to a prefetch file
+PDAT_HEADER_GROWTH = 0x20
+
+def fix_bfstp(outputBuffer: bytearray, f, pos: int, dest_bom: str, sized_refs, widths=None):
+
+    """
+    Lay out the PDAT block of a prefetch file being converted to dest_bom.
+    outputBuffer must already be big enough for the new PDAT header, as the
+    sample data is copied once, straight to its final position, and swapped
+    along the way if widths is given.
+    """
+
+    def copy(dst_pos, src_pos, length):
+        if widths:
+            byteswap_into(outputBuffer, dst_pos, f, src_pos, length, widths)
+        else:
+            outputBuffer[dst_pos:dst_pos + length] = memoryview(f)[src_pos:src_pos + length]
 
 	# Write the data to the PDAT header
     pdat_header_len: int = 0x20 if dest_bom == ">" else 0x40
     pdat_offset: int = pos - 0x8
-    pdat_len: int = int.from_bytes(outputBuffer[pdat_offset + 4:pdat_offset + 8], "little" if dest_bom == "<" else "big") - pdat_header_len // 2
+    block_size: int = int.from_bytes(outputBuffer[pdat_offset + 4:pdat_offset + 8], "little" if dest_bom == "<" else "big")
+    pdat_len: int = block_size - pdat_header_len // 2
+
+    # Copy the rest of the old header, then the data, which starts right after the new header.
+    # Since switch PDAT header is twice as big (32 vs 64), its second half is left filled with zeros
+    copy(pos, pos, 0x18)
+    copy(pdat_offset + pdat_header_len, pdat_offset + 0x20, block_size - 0x20)
+
     outputBuffer[pdat_offset + 0x4:pdat_offset + 0x8] = struct.pack(dest_bom + "I", pdat_len + pdat_header_len)
     outputBuffer[pdat_offset + 0x8:pdat_offset + 0xC] = b'\x00\x00\x00\x01' if dest_bom == ">" else b'\x01\x00\x00\x00'
     outputBuffer[pdat_offset + 0x10:pdat_offset + 0x14] = struct.pack(dest_bom + "I", pdat_len) 
     # just before the data in PDAT starts - usually stands 0x14 for WiiU (or Big Endian) and 0x54 for Switch (or Little Endian)
     outputBuffer[pdat_offset + 0x1C:pdat_offset + 0x20] = struct.pack(dest_bom + "I", 0x14 if dest_bom == ">" else 0x34)
-	
-    # since switch PDAT header is twice as big (32 vs 64), it needs to have the second half filled with zeros
-    if dest_bom == "<": 
-        for _ in range(0x20):
-            outputBuffer.insert(pdat_offset + 0x20, 0)
 
     del outputBuffer[pdat_offset + pdat_header_len + pdat_len:]
 
     # write the offset to the PDAT section and it's whole length, and fill the rest of the header with 0
     outputBuffer[0x24:0x2C] = struct.pack(dest_bom + "2I", pdat_offset, pdat_len + pdat_header_len)
-    outputBuffer[0x2C:sized_refs[1].offset] = [0]*0x14
+    outputBuffer[0x2C:sized_refs[1].offset] = bytes(0x14)
 
     # write the whole file size here
     outputBuffer[0xC:0x10] = struct.pack(dest_bom + "I", len(outputBuffer))
@@ -221,6 +224,9 @@ AMTA_HEADER = b"AMTA"
 FWAV_HEADERS = [b"FWAV", b"FSTP"]
 
 
+# Size of the chunks stream files are converted in, it must be even for the samples to be swapped
+CHUNK_SIZE = 1024 * 1024
+
 # Supported formats by the converter
 supp_STM = ["FSTM", "CSTM", "FSTP"]
 supp_WAV = ["FWAV", "CWAV"]
\ No newline at end of file
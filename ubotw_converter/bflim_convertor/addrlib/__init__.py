@@ -22,3 +22,6 @@ deswizzle = addrlib.deswizzle
 swizzle = addrlib.swizzle
 surfaceGetBitsPerPixel = addrlib.surfaceGetBitsPerPixel
 getSurfaceInfo = addrlib.getSurfaceInfo
+
+# Address map cache, only available in the Python backend
+addrMapCache = getattr(addrlib, "addrMapCache", None)
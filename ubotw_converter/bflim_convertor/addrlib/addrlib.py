@@ -4,6 +4,16 @@
 # addrlib.py
 # A Python Address Library for Wii U textures.
 
+from array import array
+from collections import OrderedDict
+import threading
+
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
+
 
 ################################################################
 ################################################################
@@ -58,26 +68,71 @@ def GX2TileModeToAddrTileMode(tileMode):
     return tileMode
 
 
-def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
-                pitch, bitsPerPixel, slice, sample, data, dataSize, swizzle):
+class AddrMapCache:
+    """
+    LRU cache of surface address maps, keyed by the surface parameters.
+    Each map is a compact array with the 32-bit swizzled offset of every
+    texel, or -1 for texels that fall outside of the data.
+    """
+
+    def __init__(self, maxSize=32):
+        self.maxSize = maxSize
+        self.maps = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, build):
+        with self.lock:
+            addrMap = self.maps.get(key)
+            if addrMap is not None:
+                self.hits += 1
+                self.maps.move_to_end(key)
+                return addrMap
+
+            self.misses += 1
+
+        addrMap = build(*key)
+
+        with self.lock:
+            self.maps[key] = addrMap
+            while len(self.maps) > self.maxSize:
+                self.maps.popitem(last=False)
+
+        return addrMap
+
+    def resize(self, maxSize):
+        with self.lock:
+            self.maxSize = maxSize
+            while len(self.maps) > self.maxSize:
+                self.maps.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.maps.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Returns (hits, misses, currSize, maxSize)
+        """
+        with self.lock:
+            return self.hits, self.misses, len(self.maps), self.maxSize
+
+
+addrMapCache = AddrMapCache()
+
+
+def computeAddrMap(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                   pitch, bitsPerPixel, slice, sample, dataSize):
 
     """
-    width: width of the surface
-    height: height of the surface
-    depth: depth of the surface
-    format_: format of the surface (GX2SurfaceFormat)
-    aa: AA mode of the surface (GX2AAMode)
-    use: use of the surface (GX2SurfaceUse)
-    tileMode: tileMode of the surface (GX2TileMode)
-    swizzle_: swizzle of the surface (GX2Surface.swizzle)
-    pitch: aligned width of the surface (can be calculated using getSurfaceInfo())
-    bitsPerPixel: bits per element for the given format (use surfaceGetBitsPerPixel())
-    data: data to be (un)swizzled
-    swizzle: boolen where the data will be swizzled if true, otherwise unswizzled
+    Computes the swizzled offset of every texel of the surface, in linear order.
+    Parameters are the same as swizzleSurf(), with dataSize being the length of the data.
     """
 
     bytesPerPixel = bitsPerPixel // 8
-    result = bytearray(len(data))
 
     if format_ in BCn_formats:
         width = (width + 3) // 4
@@ -88,6 +143,10 @@ def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
 
     tileMode = GX2TileModeToAddrTileMode(tileMode)
 
+    # 32-bit offsets, half the memory of 64-bit ones, and plenty for a Wii U surface
+    addrMap = array('i', bytes(4 * width * height))
+    i = 0
+
     for y in range(height):
         for x in range(width):
             if tileMode in [0, 1]:
@@ -100,14 +159,78 @@ def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
                 pos = computeSurfaceAddrFromCoordMacroTiled(x, y, slice, sample, bitsPerPixel, pitch, height, 1 << aa,
                                                             tileMode, bool(use & 4), pipeSwizzle, bankSwizzle)
 
-            pos_ = (y * width + x) * bytesPerPixel
+            pos_ = i * bytesPerPixel
+
+            if pos_ + bytesPerPixel <= dataSize and pos + bytesPerPixel <= dataSize:
+                addrMap[i] = pos
+
+            else:
+                addrMap[i] = -1
 
-            if pos_ + bytesPerPixel <= len(data) and pos + bytesPerPixel <= len(data):
-                if swizzle == 0:
-                    result[pos_:pos_ + bytesPerPixel] = data[pos:pos + bytesPerPixel]
+            i += 1
 
-                else:
-                    result[pos:pos + bytesPerPixel] = data[pos_:pos_ + bytesPerPixel]
+    return addrMap
+
+
+def swizzleSurf(width, height, depth, format_, aa, use, tileMode, swizzle_,
+                pitch, bitsPerPixel, slice, sample, data, dataSize, swizzle):
+
+    """
+    width: width of the surface
+    height: height of the surface
+    depth: depth of the surface
+    format_: format of the surface (GX2SurfaceFormat)
+    aa: AA mode of the surface (GX2AAMode)
+    use: use of the surface (GX2SurfaceUse)
+    tileMode: tileMode of the surface (GX2TileMode)
+    swizzle_: swizzle of the surface (GX2Surface.swizzle)
+    pitch: aligned width of the surface (can be calculated using getSurfaceInfo())
+    bitsPerPixel: bits per element for the given format (use surfaceGetBitsPerPixel())
+    data: data to be (un)swizzled
+    swizzle: boolen where the data will be swizzled if true, otherwise unswizzled
+    """
+
+    bytesPerPixel = bitsPerPixel // 8
+
+    addrMap = addrMapCache.get(
+        (width, height, depth, format_, aa, use, tileMode, swizzle_,
+         pitch, bitsPerPixel, slice, sample, len(data)),
+        computeAddrMap,
+    )
+
+    if np is not None:
+        # Gather/scatter all the texels at once
+        addrs = np.frombuffer(addrMap, dtype=np.int32)
+        inside = addrs >= 0
+
+        byteOffsets = np.arange(bytesPerPixel, dtype=np.int64)
+        swizzled = (addrs[inside, None] + byteOffsets).ravel()
+        linear = ((np.flatnonzero(inside) * bytesPerPixel)[:, None] + byteOffsets).ravel()
+
+        src = np.frombuffer(data, dtype=np.uint8)
+        result = np.zeros(len(data), dtype=np.uint8)
+
+        if swizzle == 0:
+            result[linear] = src[swizzled]
+
+        else:
+            result[swizzled] = src[linear]
+
+        return result.tobytes()
+
+    result = bytearray(len(data))
+
+    for i, pos in enumerate(addrMap):
+        if pos < 0:
+            continue
+
+        pos_ = i * bytesPerPixel
+
+        if swizzle == 0:
+            result[pos_:pos_ + bytesPerPixel] = data[pos:pos + bytesPerPixel]
+
+        else:
+            result[pos:pos + bytesPerPixel] = data[pos_:pos_ + bytesPerPixel]
 
     return bytes(result)
 
@@ -23,9 +23,18 @@
 import os.path
 import struct
 
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
+
 from . import dds
 from . import globals
 
+# Use the NumPy swizzling engine when NumPy is available
+useNumpy = np is not None
+
 SRGB_FORMATS = [0x1a06, 0x1b06, 0x1c06, 0x2006, 0xb06]
 
 class BNTXHeader(struct.Struct):
@@ -146,11 +155,64 @@ def _swizzle(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, bloc
 
     return result
 
+def _swizzle_numpy(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, data, toSwizzle):
+    """
+    Same as _swizzle, but computes the whole address map at once
+    and moves the texels with NumPy fancy indexing
+    """
+    assert 0 <= blockHeightLog2 <= 5
+    blockHeight = 1 << blockHeightLog2
+
+    width = DIV_ROUND_UP(width, blkWidth)
+    height = DIV_ROUND_UP(height, blkHeight)
+
+    if tileMode == 1:
+        pitch = width * bpp
+
+        if roundPitch:
+            pitch = round_up(pitch, 32)
+
+        surfSize = pitch * height
+        addrs = getAddrLinearArray(width, height, bpp, pitch)
+
+    else:
+        pitch = round_up(width * bpp, 64)
+        surfSize = pitch * round_up(height, blockHeight * 8)
+        addrs = getAddrBlockLinearArray(width, height, bpp, blockHeight)
+
+    if len(data) < (width * height * bpp if toSwizzle else surfSize):
+        # Truncated input, let the pure Python path handle the partial copies
+        return _swizzle(width * blkWidth, height * blkHeight, blkWidth, blkHeight, roundPitch,
+                        bpp, tileMode, blockHeightLog2, data, toSwizzle)
+
+    # Drop the texels that would fall outside of the surface
+    addrs = addrs.ravel()
+    linear = np.arange(addrs.size, dtype=np.int64) * bpp
+    inside = addrs + bpp <= surfSize
+
+    byteOffsets = np.arange(bpp, dtype=np.int64)
+    swizzled = (addrs[inside, None] + byteOffsets).ravel()
+    linear = (linear[inside, None] + byteOffsets).ravel()
+
+    src = np.frombuffer(data, dtype=np.uint8)
+    result = np.zeros(surfSize, dtype=np.uint8)
+
+    if toSwizzle:
+        result[swizzled] = src[linear]
+
+    else:
+        result[linear] = src[swizzled]
+
+    return bytearray(result.tobytes())
+
+def _getSwizzleFunc():
+    return _swizzle_numpy if useNumpy and np is not None else _swizzle
+
 def swizzle(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, data):
-    return _swizzle(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, bytes(data), 1)
+    return _getSwizzleFunc()(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, bytes(data), 1)
 
 def deswizzle(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, data):
-    return _swizzle(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, bytes(data), 0)
+    return _getSwizzleFunc()(width, height, blkWidth, blkHeight, roundPitch, bpp, tileMode, blockHeightLog2, bytes(data), 0)
 
 def getAddrBlockLinear(x, y, image_width, bytes_per_pixel, base_address, blockHeight):
     """
@@ -170,6 +232,33 @@ def getAddrBlockLinear(x, y, image_width, bytes_per_pixel, base_address, blockHe
 
     return Address
 
+def getAddrLinearArray(width, height, bytes_per_pixel, pitch):
+    """
+    Address map of a pitch linear surface, one entry per texel
+    """
+    x = np.arange(width, dtype=np.int64) * bytes_per_pixel
+    y = np.arange(height, dtype=np.int64) * pitch
+
+    return y[:, None] + x[None, :]
+
+def getAddrBlockLinearArray(width, height, bytes_per_pixel, blockHeight):
+    """
+    Vectorized getAddrBlockLinear over a whole (height, width) surface
+    """
+    image_width_in_gobs = DIV_ROUND_UP(width * bytes_per_pixel, 64)
+
+    # The GOB address is separable into a row and a column term
+    y = np.arange(height, dtype=np.int64)
+    rows = ((y // (8 * blockHeight)) * 512 * blockHeight * image_width_in_gobs
+            + (y % (8 * blockHeight) // 8) * 512
+            + ((y % 8) // 2) * 64 + (y % 2) * 16)
+
+    x = np.arange(width, dtype=np.int64) * bytes_per_pixel
+    columns = ((x // 64) * 512 * blockHeight + ((x % 64) // 32) * 256
+               + ((x % 32) // 16) * 32 + (x % 16))
+
+    return rows[:, None] + columns[None, :]
+
 def DIV_ROUND_UP(n, d):
     return (n + d - 1) // d
 
@@ -201,124 +290,6 @@ def getBlockHeight(height):
 
     return blockHeight
 
-def read(file):
-    with open(file, "rb") as inf:
-        f = inf.read()
-
-    pos = 0
-
-    if f[0xc:0xe] == b'\xFF\xFE':
-        bom = '<'
-
-    elif f[0xc:0xe] == b'\xFE\xFF':
-        bom = '>'
-
-    else:
-        print("Invalid BOM!")
-        return False
-
-    header = BNTXHeader(bom)
-    header.data(f, pos)
-    pos += header.size
-
-    if header.magic != b'BNTX\0\0\0\0':
-        print("Invalid file header!")
-        return False
-
-    fnameLen = struct.unpack(bom + 'H', f[header.fileNameAddr - 2:header.fileNameAddr])[0]
-    fname = bytes_to_string(f[header.fileNameAddr:header.fileNameAddr + fnameLen], fnameLen)
-
-    texContainer = TexContainer(bom)
-    texContainer.data(f, pos)
-    pos += texContainer.size
-
-    if texContainer.target not in [b'NX  ', b'Gen ']:
-        print("Unsupported target platform!")
-        return False
-
-    target = 0 if texContainer.target == b'Gen ' else 1
-
-    textures = {}
-    texNames = []
-    texSizes = []
-
-    for i in range(texContainer.count):
-        pos = struct.unpack(bom + 'q', f[texContainer.infoPtrsAddr + i * 8:texContainer.infoPtrsAddr + i * 8 + 8])[0]
-
-        infoHeader = BlockHeader(bom)
-        infoHeader.data(f, pos)
-        pos += infoHeader.size
-
-        info = TextureInfo(bom)
-        info.data(f, pos)
-
-        if infoHeader.magic != b'BRTI':
-            continue
-
-        nameLen = struct.unpack(bom + 'H', f[info.nameAddr:info.nameAddr + 2])[0]
-        name = bytes_to_string(f[info.nameAddr + 2:info.nameAddr + 2 + nameLen], nameLen)
-
-        compSel = []
-        compSel2 = []
-        for i in range(4):
-            value = (info.compSel >> (8 * (3 - i))) & 0xff
-            compSel2.append(value)
-            if value == 0:
-                value = 5 - len(compSel)
-
-            compSel.append(value)
-
-        if info.type_ not in globals.types:
-            globals.types[info.type_] = "Unknown"
-
-        dataAddr = struct.unpack(bom + 'q', f[info.ptrsAddr:info.ptrsAddr + 8])[0]
-        mipOffsets = {0: 0}
-
-        for i in range(1, info.numMips):
-            mipOffset = struct.unpack(bom + 'q', f[info.ptrsAddr + (i * 8):info.ptrsAddr + (i * 8) + 8])[0]
-            mipOffsets[i] = mipOffset - dataAddr
-
-        tex = TexInfo()
-
-        tex.infoAddr = pos
-        tex.info = info
-        tex.bom = bom
-        tex.target = target
-
-        tex.name = name
-
-        tex.readTexLayout = info.flags & 1
-        tex.sparseBinding = info.flags >> 1
-        tex.sparseResidency = info.flags >> 2
-        tex.dim = info.dim
-        tex.tileMode = info.tileMode
-        tex.numMips = info.numMips
-        tex.width = info.width
-        tex.height = info.height
-        tex.format = info.format_
-        tex.arrayLength = info.arrayLength
-        tex.blockHeightLog2 = info.textureLayout & 7
-        tex.imageSize = info.imageSize
-
-        tex.compSel = compSel
-        tex.compSel2 = compSel2
-
-        tex.alignment = info.alignment
-        tex.type = info.type_
-
-        tex.mipOffsets = mipOffsets
-        tex.dataAddr = dataAddr
-
-        tex.data = f[dataAddr:dataAddr + info.imageSize]
-
-        textures[name] = tex
-        texSizes.append(info.imageSize)
-
-    globals.fileData = bytearray(f)
-    globals.texSizes = texSizes
-
-    return fname, texContainer.target.decode('utf-8'), textures
-
 def decode(tex):
     if (tex.format >> 8) in globals.blk_dims:
         blkWidth, blkHeight = globals.blk_dims[tex.format >> 8]
@@ -486,6 +457,10 @@ def inject(tex, tileMode, SRGB, sparseBinding, sparseResidency, oldImageSize, fl
             max(0, blockHeightLog2 - blockHeightShift), data_,
         ))
 
+    # Check before touching tex, which is shared with the BntxFile it came from
+    if surfSize > oldImageSize:
+        raise ValueError(f"{tex.name} is bigger than the texture it replaces")
+
     tex.readTexLayout = 1 if tileMode == 0 else 0
     tex.sparseBinding = sparseBinding
     tex.sparseResidency = sparseResidency
@@ -509,56 +484,201 @@ def inject(tex, tileMode, SRGB, sparseBinding, sparseResidency, oldImageSize, fl
     return tex
 
 
-def writeTex(file, tex, oldImageSize, oldNumMips):
-    compSel = tex.compSel[0] << 24 | tex.compSel[1] << 16 | tex.compSel[2] << 8 | tex.compSel[3]
+class BntxFile:
+    """
+    A BNTX file that owns its data, so several of them can be edited at once
+    """
 
-    if not tex.readTexLayout:
-        textureLayout = 0
+    def __init__(self, data=b''):
+        self.buffer = bytearray(data)
+        self.view = memoryview(self.buffer)
 
-    else:
-        textureLayout = tex.sparseResidency << 5 | tex.sparseBinding << 4 | tex.blockHeightLog2
-
-    infoHead = TextureInfo(tex.bom).pack(
-        tex.sparseResidency << 2 | tex.sparseBinding << 1 | tex.readTexLayout,
-        tex.dim,
-        tex.tileMode,
-        tex.info.swizzle,
-        tex.numMips,
-        tex.info.numSamples,
-        tex.format,
-        tex.info.accessFlags,
-        tex.width,
-        tex.height,
-        tex.info.depth,
-        tex.arrayLength,
-        textureLayout,
-        tex.info.textureLayout2,
-        tex.imageSize,
-        tex.alignment,
-        compSel,
-        tex.type,
-        tex.info.nameAddr,
-        tex.info.parentAddr,
-        tex.info.ptrsAddr,
-        tex.info.userDataAddr,
-        tex.info.texPtr,
-        tex.info.texViewPtr,
-        tex.info.descSlotDataAddr,
-        tex.info.userDictAddr,
-    )
-
-    globals.fileData[tex.infoAddr:tex.infoAddr + 144] = infoHead
-
-    ptrs = bytearray(oldNumMips * 8)
+        self.name = ''
+        self.target = ''
+        self.textures = {}
+        self.texSizes = []
 
-    for mipLevel in tex.mipOffsets:
-        mipOffset = tex.mipOffsets[mipLevel]
-        ptrs[mipLevel * 8:mipLevel * 8 + 8] = struct.pack(tex.bom + 'q', tex.dataAddr + mipOffset)
+        if data:
+            self.read()
+
+    @classmethod
+    def open(cls, file):
+        with open(file, "rb") as inf:
+            return cls(inf.read())
+
+    def read(self):
+        f = self.buffer
+
+        pos = 0
+
+        if f[0xc:0xe] == b'\xFF\xFE':
+            bom = '<'
+
+        elif f[0xc:0xe] == b'\xFE\xFF':
+            bom = '>'
+
+        else:
+            raise ValueError("Invalid BOM!")
+
+        header = BNTXHeader(bom)
+        header.data(f, pos)
+        pos += header.size
+
+        if header.magic != b'BNTX\0\0\0\0':
+            raise ValueError("Invalid file header!")
+
+        fnameLen = struct.unpack(bom + 'H', f[header.fileNameAddr - 2:header.fileNameAddr])[0]
+        fname = bytes_to_string(f[header.fileNameAddr:header.fileNameAddr + fnameLen], fnameLen)
+
+        texContainer = TexContainer(bom)
+        texContainer.data(f, pos)
+        pos += texContainer.size
+
+        if texContainer.target not in [b'NX  ', b'Gen ']:
+            raise ValueError("Unsupported target platform!")
+
+        target = 0 if texContainer.target == b'Gen ' else 1
+
+        textures = {}
+        texSizes = []
+
+        for i in range(texContainer.count):
+            pos = struct.unpack(bom + 'q', f[texContainer.infoPtrsAddr + i * 8:texContainer.infoPtrsAddr + i * 8 + 8])[0]
+
+            infoHeader = BlockHeader(bom)
+            infoHeader.data(f, pos)
+            pos += infoHeader.size
+
+            info = TextureInfo(bom)
+            info.data(f, pos)
+
+            if infoHeader.magic != b'BRTI':
+                continue
+
+            nameLen = struct.unpack(bom + 'H', f[info.nameAddr:info.nameAddr + 2])[0]
+            name = bytes_to_string(f[info.nameAddr + 2:info.nameAddr + 2 + nameLen], nameLen)
+
+            compSel = []
+            compSel2 = []
+            for i in range(4):
+                value = (info.compSel >> (8 * (3 - i))) & 0xff
+                compSel2.append(value)
+                if value == 0:
+                    value = 5 - len(compSel)
+
+                compSel.append(value)
+
+            if info.type_ not in globals.types:
+                globals.types[info.type_] = "Unknown"
+
+            dataAddr = struct.unpack(bom + 'q', f[info.ptrsAddr:info.ptrsAddr + 8])[0]
+            mipOffsets = {0: 0}
+
+            for i in range(1, info.numMips):
+                mipOffset = struct.unpack(bom + 'q', f[info.ptrsAddr + (i * 8):info.ptrsAddr + (i * 8) + 8])[0]
+                mipOffsets[i] = mipOffset - dataAddr
+
+            tex = TexInfo()
+
+            tex.infoAddr = pos
+            tex.info = info
+            tex.bom = bom
+            tex.target = target
+
+            tex.name = name
+
+            tex.readTexLayout = info.flags & 1
+            tex.sparseBinding = info.flags >> 1
+            tex.sparseResidency = info.flags >> 2
+            tex.dim = info.dim
+            tex.tileMode = info.tileMode
+            tex.numMips = info.numMips
+            tex.width = info.width
+            tex.height = info.height
+            tex.format = info.format_
+            tex.arrayLength = info.arrayLength
+            tex.blockHeightLog2 = info.textureLayout & 7
+            tex.imageSize = info.imageSize
+
+            tex.compSel = compSel
+            tex.compSel2 = compSel2
+
+            tex.alignment = info.alignment
+            tex.type = info.type_
+
+            tex.mipOffsets = mipOffsets
+            tex.dataAddr = dataAddr
+
+            tex.data = self.view[dataAddr:dataAddr + info.imageSize]
+
+            textures[name] = tex
+            texSizes.append(info.imageSize)
+
+        self.name = fname
+        self.target = texContainer.target.decode('utf-8')
+        self.textures = textures
+        self.texSizes = texSizes
+
+        return fname, self.target, textures
+
+    def injectTex(self, tex, oldImageSize, oldNumMips):
+        # Check everything before writing anything, so a failed injection leaves the file as it was
+        if tex.imageSize > oldImageSize:
+            raise ValueError(f"{tex.name} is bigger than the texture it replaces")
+
+        if len(tex.mipOffsets) > oldNumMips:
+            raise ValueError(f"{tex.name} has more mipmaps than the texture it replaces")
+
+        compSel = tex.compSel[0] << 24 | tex.compSel[1] << 16 | tex.compSel[2] << 8 | tex.compSel[3]
+
+        if not tex.readTexLayout:
+            textureLayout = 0
+
+        else:
+            textureLayout = tex.sparseResidency << 5 | tex.sparseBinding << 4 | tex.blockHeightLog2
+
+        infoHead = TextureInfo(tex.bom).pack(
+            tex.sparseResidency << 2 | tex.sparseBinding << 1 | tex.readTexLayout,
+            tex.dim,
+            tex.tileMode,
+            tex.info.swizzle,
+            tex.numMips,
+            tex.info.numSamples,
+            tex.format,
+            tex.info.accessFlags,
+            tex.width,
+            tex.height,
+            tex.info.depth,
+            tex.arrayLength,
+            textureLayout,
+            tex.info.textureLayout2,
+            tex.imageSize,
+            tex.alignment,
+            compSel,
+            tex.type,
+            tex.info.nameAddr,
+            tex.info.parentAddr,
+            tex.info.ptrsAddr,
+            tex.info.userDataAddr,
+            tex.info.texPtr,
+            tex.info.texViewPtr,
+            tex.info.descSlotDataAddr,
+            tex.info.userDictAddr,
+        )
+
+        self.buffer[tex.infoAddr:tex.infoAddr + 144] = infoHead
+
+        ptrs = bytearray(oldNumMips * 8)
+
+        for mipLevel in tex.mipOffsets:
+            mipOffset = tex.mipOffsets[mipLevel]
+            ptrs[mipLevel * 8:mipLevel * 8 + 8] = struct.pack(tex.bom + 'q', tex.dataAddr + mipOffset)
 
-    globals.fileData[tex.info.ptrsAddr:tex.info.ptrsAddr + oldNumMips * 8] = ptrs
+        self.buffer[tex.info.ptrsAddr:tex.info.ptrsAddr + oldNumMips * 8] = ptrs
 
-    data = b''.join([tex.data, b'\0' * (oldImageSize - tex.imageSize)])
-    globals.fileData[tex.dataAddr:tex.dataAddr + oldImageSize] = data
+        data = b''.join([tex.data, b'\0' * (oldImageSize - tex.imageSize)])
+        self.buffer[tex.dataAddr:tex.dataAddr + oldImageSize] = data
 
-    with open(file, "wb+") as out:
-        out.write(globals.fileData)
+    def write(self, file):
+        with open(file, "wb+") as out:
+            out.write(self.buffer)
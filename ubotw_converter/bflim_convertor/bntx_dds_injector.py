@@ -1,24 +1,16 @@
 from . import bntx as BNTX
-from pathlib import Path
+from typing import Dict
 from . import bflim_extract
 from . import addrlib
 
-def tex_inject(bntx: Path, bflim: Path):
-    # Read the bflim file
-    with open(bflim, 'rb') as f:
-        inb = f.read()
-
+def _inject_flim(bntx_file: BNTX.BntxFile, tex_name: str, inb: bytes):
     # Format and store the flim bytes
     flim = bflim_extract.readFLIM(inb)
 
-    # Read the bntx file
-    bntx_file = BNTX.read(bntx)
-
-    # Store the name, target, textures and tex_names of the bntx file
-    name, target, textures = bntx_file
+    textures = bntx_file.textures
 
     # Store the texture name as a variable
-    o_tex = ' '.join([x for x in textures.keys() if x == bflim.stem])
+    o_tex = ' '.join([x for x in textures.keys() if x == tex_name])
 
     # Set up the variables for import the dds file
     tile_mode = textures[o_tex].tileMode
@@ -31,5 +23,17 @@ def tex_inject(bntx: Path, bflim: Path):
     tex_ = BNTX.inject(textures[o_tex], 1, srgb, sparse_binding, sparse_residency, old_tex_size, flim)
 
     if tex_:
-        # Write to the bntx
-        BNTX.writeTex(bntx, tex_, old_tex_size, old_tex_num_mips)
\ No newline at end of file
+        # Write to the bntx data in memory
+        bntx_file.injectTex(tex_, old_tex_size, old_tex_num_mips)
+    else:
+        raise ValueError(f"{tex_name} could not be injected")
+
+def inject_flims(bntx_file: BNTX.BntxFile, flims: Dict[str, bytes]) -> Dict[str, Exception]:
+    # Inject several bflims, given as texture name -> bflim bytes, into a bntx in memory
+    failed = {}
+    for tex_name, inb in flims.items():
+        try:
+            _inject_flim(bntx_file, tex_name, inb)
+        except Exception as err:
+            failed[tex_name] = err
+    return failed
@@ -144,6 +144,3 @@ bpps = {  # format -> bytes_per_pixel
     0x37: 0x10, 0x38: 0x10, 0x39: 0x10, 0x3a: 0x10,
 }
 
-
-fileData = bytearray()
-texSizes = []
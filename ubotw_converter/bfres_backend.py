@@ -0,0 +1,85 @@
+"""bfres_backend.py: BfresLibrary through pythonnet, loaded the first time it's needed"""
+
+from pathlib import Path
+from typing import Optional, Union
+import ctypes
+import logging
+import threading
+import time
+
+# Import dll libraries
+BFRES_DLL: Path = Path(__file__).parent / "dotnet_libs" / "BfresLibrary"
+
+class BfresBackend:
+    """
+    The .NET runtime and the BfresLibrary types used to convert bfres
+    files. Data crosses the .NET boundary with a single Marshal.Copy each
+    way, instead of going through pythonnet's conversions.
+    """
+
+    def __init__(self):
+        import clr
+        clr.AddReference(str(BFRES_DLL))
+        from System import Array, Byte, Int64, IntPtr
+        from System.IO import MemoryStream
+        from System.Runtime.InteropServices import Marshal
+        from BfresLibrary import ResFile
+        from BfresLibrary.PlatformConverters import ConverterHandle
+
+        self.Array = Array
+        self.Byte = Byte
+        self.Int64 = Int64
+        self.IntPtr = IntPtr
+        self.MemoryStream = MemoryStream
+        self.Marshal = Marshal
+        self.ResFile = ResFile
+        self.ConverterHandle = ConverterHandle
+
+    def _pointer(self, address: int):
+        return self.IntPtr(self.Int64(address))
+
+    def to_stream(self, data: Union[bytes, bytearray, memoryview]):
+        # Copy a python buffer into a read-only MemoryStream
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data)
+        array = self.Array.CreateInstance(self.Byte, len(data))
+        if data:
+            if isinstance(data, bytes):
+                # Points straight at the bytes object's buffer
+                source = ctypes.c_char_p(data)
+                address = ctypes.cast(source, ctypes.c_void_p).value
+            else:
+                source = (ctypes.c_char * len(data)).from_buffer(data)
+                address = ctypes.addressof(source)
+            self.Marshal.Copy(self._pointer(address), array, 0, len(data))
+        return self.MemoryStream(array, False)
+
+    def from_stream(self, stream) -> bytearray:
+        # Copy what was written to a MemoryStream into a python buffer, without ToArray's copy
+        if not stream.CanRead:
+            # Closed streams only allow ToArray
+            return bytearray(bytes(stream.ToArray()))
+        data = bytearray(int(stream.Length))
+        if data:
+            target = (ctypes.c_char * len(data)).from_buffer(data)
+            self.Marshal.Copy(stream.GetBuffer(), 0, self._pointer(ctypes.addressof(target)), len(data))
+        return data
+
+    def save(self, res_file) -> bytearray:
+        # ResFile.Save closes the stream it's given, unless told to leave it open
+        stream = self.MemoryStream()
+        res_file.Save(stream, True)
+        return self.from_stream(stream)
+
+_backend: Optional[BfresBackend] = None
+_lock = threading.Lock()
+
+def get_bfres_backend() -> BfresBackend:
+    # Boot the .NET runtime on first use, so workers that never see a bfres file skip it
+    global _backend
+    with _lock:
+        if _backend is None:
+            start = time.perf_counter()
+            _backend = BfresBackend()
+            logging.getLogger(__name__).debug(f"Loaded BfresLibrary in {time.perf_counter() - start:.3f}s")
+        return _backend
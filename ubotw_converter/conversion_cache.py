@@ -0,0 +1,124 @@
+"""conversion_cache.py: an on-disk cache of converted files, addressed by their contents"""
+
+from pathlib import Path
+from typing import Optional, Union
+import os
+import shutil
+import xxhash
+
+# Bump this whenever the output of a converter changes, so old entries are never used
+CONVERTER_VERSION = 1
+# Default size limit of the cache, in bytes
+DEFAULT_MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+class ConversionCache:
+    """
+    Converted files, stored under a key made from the converter, its version
+    and the hash of the decompressed input. Entries are evicted least recently
+    used first once the cache grows over max_size, see evict.
+    """
+
+    def __init__(self, root: Path, max_size: int = DEFAULT_MAX_SIZE):
+        self.root = Path(root)
+        self.max_size = max_size
+
+    def key(self, converter: str, *parts: Union[str, int, bytes]) -> str:
+        digest = xxhash.xxh64(f"{converter}:{CONVERTER_VERSION}".encode("utf-8"))
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            elif isinstance(part, int):
+                part = part.to_bytes(8, "little")
+            # Prefix every part with its size, so two lists of parts never hash the same
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _tmp_path(self, key: str) -> Path:
+        return self._path(key).with_name(f"{key}.{os.getpid()}.tmp")
+
+    def _touch(self, path: Path) -> None:
+        # The modification time of an entry is when it was last used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        return data
+
+    def get_file(self, key: str, dest: Path) -> bool:
+        # Copy an entry over dest without loading it, returns False if there's none
+        path = self._path(key)
+        tmp_file = dest.with_name(f"{dest.name}.tmp")
+        try:
+            shutil.copyfile(path, tmp_file)
+        except FileNotFoundError:
+            return False
+        os.replace(tmp_file, dest)
+        self._touch(path)
+        return True
+
+    def put(self, key: str, data: bytes) -> None:
+        # Entries are written to a temporary file first, so no worker ever reads a partial one.
+        # The cache is only an optimization, so failing to write to it is not an error
+        tmp_file = self._tmp_path(key)
+        try:
+            tmp_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file.write_bytes(data)
+            os.replace(tmp_file, self._path(key))
+        except OSError:
+            _unlink(tmp_file)
+
+    def put_file(self, key: str, src: Path) -> None:
+        tmp_file = self._tmp_path(key)
+        try:
+            tmp_file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(src, tmp_file)
+            os.replace(tmp_file, self._path(key))
+        except OSError:
+            _unlink(tmp_file)
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits in
+        max_size. Should only run while no worker uses the cache, returns
+        the number of entries removed.
+        """
+        entries = []
+        for path in self.root.glob("??/*"):
+            if path.suffix == ".tmp":
+                # Left behind by an interrupted run
+                _unlink(path)
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            _unlink(path)
+            size -= entry_size
+            removed += 1
+        return removed
+
+def _unlink(path: Path) -> None:
+    # Path.unlink(missing_ok=True) needs Python 3.8
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
@@ -8,14 +8,21 @@ from zipfile import ZipFile
 from platform import system 
 from json import loads
 from pathlib import Path
-from multiprocessing import get_context
-from typing import Union
+from multiprocessing import get_all_start_methods, get_context
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import sys
+import os
 import shutil
+import threading
 import argparse
 import traceback
 import logging
 import logging.config
+import time
 import xxhash
 
 from bcml.install import open_mod, find_modded_files
@@ -23,19 +30,17 @@ from bcml.dev import convert_mod, NO_CONVERT_EXTS
 from bcml import util
 from .bars_py import bars, bcf_converter
 from .bflim_convertor import bntx_dds_injector as bntx
+from .bflim_convertor.bntx import BntxFile
+from .conversion_cache import ConversionCache
+from .bfres_backend import get_bfres_backend
+from .hash_index import get_hash_index
+from . import havok
+from .game_index import find_stock_file, find_stock_member, get_game_file, get_game_index
+from .stock_cache import get_stock_bars_tracks, get_stock_file
 import oead
 
 SCRIPT: Path = Path(__file__).parent
 
-# Import dll libraries
-BFRES_DLL = SCRIPT / "dotnet_libs" / "BfresLibrary"
-
-import clr
-clr.AddReference(str(BFRES_DLL))
-from System.IO import MemoryStream, File
-from BfresLibrary import ResFile
-from BfresLibrary.PlatformConverters import ConverterHandle
-
 # Supported formats
 SUPPORTED = [".sbfres", ".sbitemico", ".hkcl", ".hkrg", ".shknm2", ".bars", ".bfstm", ".bflim", ".sblarc", ".bcamanim"]
 
@@ -44,39 +49,214 @@ HAVOK_EXT = [".hkcl", ".hkrg", ".shknm2"]
 LAYOUT_EXT = [".bflan", ".bgsh", ".bnsh", ".bushvt", ".bflyt", ".bflim", ".bntx"]
 SOUND_EXT = [".bfstm", ".bfstp", ".bfwav", ".bars"]
 
-# Construct an argument parser
-parser = argparse.ArgumentParser(description="Converts mods in BNP format using BCML's converter, complemented by some additional tools")
-parser.add_argument("bnp", nargs='+')
-parser.add_argument("-o", "--output", help="Specify an output file")
-parser.add_argument("-s", "--single", help="Use single core", action="store_true")
-parser.add_argument("-log", "--log-level", default="warning", help="Set the logging level. Example --log-level debug. Default is warning")
-args = parser.parse_args()
+# Relative cost per byte of each converter, used to schedule the biggest jobs first
+CONVERTER_COST = {"bfres": 4, "havok": 6, "bars": 2, "bfstm": 1, "bflim": 3, "pack": 2, "stock": 1}
+# Fixed cost of a job, in bytes, like HKXConvert's process startups
+JOB_OVERHEAD = {"havok": 1 << 20, "pack": 1 << 16}
+# Extra cost of every member of a pack
+PACK_MEMBER_COST = 1 << 14
+# Havok files of a mod are converted in batches of up to this many files, one
+# batch per job, so big havok mods are still spread over every worker
+HAVOK_BATCH_SIZE = 8
+# Loose files which are converted without being loaded, see convert_bfstm. From
+# STREAM_SIZE on, they are hashed in chunks too. Other files are loaded anyway, so
+# they are hashed from the loaded bytes
+STREAMED_EXT = [".bfstm"]
+STREAM_SIZE = 16 * 1024 * 1024
 
 LOG_CONF = SCRIPT / "log.conf"
 ERROR_LOG = SCRIPT / "error.log"
+HASH_INDEX = SCRIPT / "cache" / "wiiu_hashes.idx"
 
-# Error logging
-logging.config.fileConfig(fname=LOG_CONF, defaults={"logfilename": ERROR_LOG, "loglevel": args.log_level.upper()})
 logger = logging.getLogger(__name__)
 
-def is_file_modded(name: str, file: Union[bytes, Path], count_new: bool = True) -> bool:
-    table = util.get_hash_table(True)
+def setup_logging(level: str = "warning", mode: str = "w") -> None:
+    # Error logging, to the console and ERROR_LOG. Loggers created on import keep working
+    logging.config.fileConfig(
+        fname=LOG_CONF,
+        defaults={"logfilename": ERROR_LOG, "logfilemode": mode, "loglevel": level.upper()},
+        disable_existing_loggers=False,
+    )
+
+@dataclass
+class ConvertOptions:
+    # Output file, without the .bnp extension. Defaults to <mod>_switch.bnp next to the mod
+    output: Optional[Path] = None
+    # Convert in this process instead of a pool of workers
+    single: bool = False
+    # Folder of the conversion cache, see ConversionCache
+    cache_dir: Optional[Path] = None
+    # Logging level of the workers, None leaves their logging as it is
+    log_level: Optional[str] = None
+    # Fork the workers from a server with the heavy modules already imported, see PRELOAD_MODULES
+    preload: bool = False
+
+@dataclass
+class ConvertResult:
+    mod: Path
+    # The converted bnp, None if the conversion failed
+    output: Optional[Path] = None
+    # Files which could not be converted, relative to the mod's root
+    failed: List[Path] = field(default_factory=list)
+    # BCML's converter warnings
+    warnings: List[str] = field(default_factory=list)
+    # Traceback of the error that stopped the conversion
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.failed
+
+class FileContext:
+    """
+    A file going through the conversion pipeline. Its raw bytes, decompressed
+    bytes and hash are loaded once, the first time they are needed.
+    """
+
+    def __init__(self, name: str, raw: Optional[bytes] = None, path: Optional[Path] = None):
+        self.name = name
+        self.path = path
+        self._raw = raw
+        self._data = None
+        self._hash = None
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = self.path.read_bytes()
+        return self._raw
+
+    @property
+    def data(self) -> bytes:
+        # The file contents, without Yaz0 compression
+        if self._data is None:
+            if self.raw[0:4] == b"Yaz0":
+                try:
+                    self._data = bytes(util.decompress(self.raw))
+                except RuntimeError as err:
+                    raise ValueError(f"Invalid yaz0 file {self.name}") from err
+            else:
+                self._data = self.raw
+        return self._data
+
+    @property
+    def size(self) -> int:
+        if self._raw is None and self.path is not None:
+            return self.path.stat().st_size
+        return len(self.raw)
+
+    @property
+    def streamed(self) -> bool:
+        return Path(self.name).suffix in STREAMED_EXT
+
+    @property
+    def hash(self) -> int:
+        if self._hash is None:
+            if self._raw is None and self.path is not None and self.streamed and self.size >= STREAM_SIZE:
+                self._hash = self._hash_file()
+            else:
+                self._hash = xxhash.xxh64_intdigest(self.data)
+        return self._hash
+
+    def _hash_file(self) -> int:
+        # Hash a big file without loading it, unless it needs decompressing first
+        with open(self.path, "rb") as f:
+            if f.read(4) == b"Yaz0":
+                return xxhash.xxh64_intdigest(self.data)
+            f.seek(0)
+            digest = xxhash.xxh64()
+            for chunk in iter(lambda: f.read(bcf_converter.CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.intdigest()
+
+def is_file_modded(name: str, file: Union[bytes, Path, FileContext], count_new: bool = True) -> bool:
+    table = get_hash_index(HASH_INDEX, True)
     if name not in table:
         return count_new
-    contents = (
-        file
-        if isinstance(file, bytes)
-        else file.read_bytes()
-        if isinstance(file, Path)
-        else bytes(file)
-    )
-    if contents[0:4] == b"Yaz0":
-        try:
-            contents = util.decompress(contents)
-        except RuntimeError as err:
-            raise ValueError(f"Invalid yaz0 file {name}") from err
-    fhash = xxhash.xxh64_intdigest(contents)
-    return not fhash in table[name]
+    if not isinstance(file, FileContext):
+        file = FileContext(name, path=file) if isinstance(file, Path) else FileContext(name, bytes(file))
+    return not table.is_stock(name, file.hash)
+
+# Stems of the bfstm files of the last mods seen by this process, see get_bfstm_index
+bfstm_indexes: "OrderedDict[Path, FrozenSet[str]]" = OrderedDict()
+bfstm_indexes_lock = threading.Lock()
+# How many mods can be in flight at once in a worker, so indexes of finished mods are dropped
+MAX_BFSTM_INDEXES = 8
+
+def build_bfstm_index(mod_path: Path) -> FrozenSet[str]:
+    # Walk the mod once, so bars tracks can be looked up without an rglob each
+    return frozenset(file.stem for file in mod_path.rglob("*.bfstm"))
+
+def get_bfstm_index(mod_path: Path) -> FrozenSet[str]:
+    with bfstm_indexes_lock:
+        if mod_path in bfstm_indexes:
+            bfstm_indexes.move_to_end(mod_path)
+        else:
+            bfstm_indexes[mod_path] = build_bfstm_index(mod_path)
+            if len(bfstm_indexes) > MAX_BFSTM_INDEXES:
+                bfstm_indexes.popitem(last=False)
+        return bfstm_indexes[mod_path]
+
+def mod_has_bfstm(track: str, mod_path: Optional[Path]) -> bool:
+    return mod_path is not None and track in get_bfstm_index(mod_path)
+
+# Cache of converted files shared between runs, see set_conversion_cache
+conversion_cache: Optional[ConversionCache] = None
+
+def set_conversion_cache(cache: Optional[ConversionCache]) -> None:
+    global conversion_cache
+    conversion_cache = cache
+
+# BCML settings used while converting files
+WORKER_SETTINGS = {"wiiu": False}
+
+# Held around every call into BCML from the main process. BCML's settings and caches
+# are global, and TempSettingsContext (also used by convert_mod) isn't thread-safe,
+# so mods in flight only overlap while their files are converted by the workers
+bcml_lock = threading.RLock()
+
+# How many HKXConvert processes a pool worker runs at once, as there's already a worker per CPU
+HKX_PROCS_PER_WORKER = 2
+# HKXConvert processes this process may run at once, see init_worker. None uses every CPU
+hkx_procs: Optional[int] = None
+
+# Modules imported once by the fork server, instead of by every worker. BfresLibrary
+# isn't one of them, the .NET runtime is only started in the workers that need it
+PRELOAD_MODULES = ["oead", "xxhash", "bcml.util", "bcml.install", "bcml.dev", "ubotw_converter.converter"]
+
+# When this worker finished starting up, see worker_ready_at
+worker_ready: Optional[float] = None
+
+def worker_ready_at(_=None) -> float:
+    return worker_ready
+
+def init_worker(cache: Optional[ConversionCache], log_level: Optional[str] = None, settings: Optional[dict] = None,
+                max_hkx_procs: Optional[int] = None) -> None:
+    # Pool initializer, hands the conversion cache, BCML settings and HKXConvert budget to every worker
+    global worker_ready, hkx_procs
+    if log_level is not None:
+        # Every worker appends to the log the main process started
+        setup_logging(log_level, "a")
+    if settings is not None:
+        # Set in the worker itself, so workers started while the main process
+        # runs BCML's converter with its own settings still get them
+        util.get_settings()
+        util.get_settings.settings.update(settings)
+    set_conversion_cache(cache)
+    hkx_procs = max_hkx_procs
+    worker_ready = time.time()
+
+def cached_conversion(converter: str, convert: Callable[[], bytes], *key_parts: Union[str, int, bytes]) -> bytes:
+    # Look for a conversion in the cache before doing it, and store its result
+    if conversion_cache is None:
+        return convert()
+
+    key = conversion_cache.key(converter, *key_parts)
+    data = conversion_cache.get(key)
+    if data is None:
+        data = convert()
+        conversion_cache.put(key, data)
+    return data
 
 def confirm_prompt(question: str) -> bool:
     # https://gist.github.com/garrettdreyfus/8153571
@@ -85,205 +265,372 @@ def confirm_prompt(question: str) -> bool:
         reply = input(f"{question} (Y/n): ").lower()
     return reply in ("", "y")
 
-def extract_sarc(sarc: oead.Sarc, sarc_path: Path) -> None:
-    # Extract the data from a SARC file
-    Path(sarc_path).mkdir(exist_ok=True)
-    for file in sarc.get_files():
-        if not Path(sarc_path / file.name).parent.exists():
-            Path(sarc_path / file.name).parent.mkdir(parents=True)
-        Path(sarc_path / file.name).write_bytes(file.data)
-
-def write_sarc(sarc: oead.Sarc, sarc_path: Path, sarc_file: Path) -> None:
-    # Overwrite the SARC file with the modified files
+def write_sarc(files: Dict[str, bytes], compress: bool = True) -> bytes:
+    # Build a Switch SARC file from its members
     new_sarc = oead.SarcWriter(endian=oead.Endianness.Little)
-    for file in sarc_path.rglob("*.*"):
-        new_file = f'{file}'.split(f"{sarc_file.name}{sep}")[1].replace("\\", "/")
-        new_sarc.files[new_file] = file.read_bytes()
-    if sarc_file.suffix == ".pack":
-        sarc_file.write_bytes(new_sarc.write()[1])
+    for name, data in files.items():
+        new_sarc.files[name] = data
+    if compress:
+        return bytes(oead.yaz0.compress(new_sarc.write()[1]))
     else:
-        sarc_file.write_bytes(oead.yaz0.compress(new_sarc.write()[1]))
+        return bytes(new_sarc.write()[1])
 
-def convert_bfres(sbfres: Path) -> None:
+def convert_bfres_data(file: FileContext, tex2: Optional[bytes] = None) -> Optional[Tuple[str, bytes]]:
+    # Returns the new name and data of the file, or None if it's already a Switch file
+    if conversion_cache is None:
+        return change_bfres_platform(file, tex2)
+
+    def convert() -> bytes:
+        # The cache only stores bytes, so keep the new name in front of the data
+        converted = change_bfres_platform(file, tex2)
+        return b"" if converted is None else converted[0].encode("utf-8") + b"\0" + converted[1]
+
+    entry = cached_conversion(
+        "bfres", convert, Path(file.name).name, file.hash, xxhash.xxh64_intdigest(tex2) if tex2 is not None else 0
+    )
+    if not entry:
+        return None
+    new_name, _, new_bfres = entry.partition(b"\0")
+    return new_name.decode("utf-8"), new_bfres
+
+def change_bfres_platform(file: FileContext, tex2: Optional[bytes] = None) -> Optional[Tuple[str, bytes]]:
     # Based on https://github.com/KillzXGaming/BfresPlatformConverter
-    name: str = sbfres.stem
-    ext: str = sbfres.suffix
+    file_name: str = Path(file.name).name
+    name: str = Path(file_name).stem
+    ext: str = Path(file_name).suffix
 
-    bfres: bytes = util.unyaz_if_needed(sbfres.read_bytes())
+    # BfresLibrary is only loaded once a bfres file needs it
+    dotnet = get_bfres_backend()
+    timings = [("start", time.perf_counter())]
 
-    res_file: ResFile = ResFile(MemoryStream(bfres))
+    res_file = dotnet.ResFile(dotnet.to_stream(file.data))
+    timings.append(("load", time.perf_counter()))
 
-    if ".Tex1" in sbfres.suffixes and max({i.MipCount for i in list(res_file.Textures.Values)}) > 1:
-        tex2: Path = Path(str(sbfres).replace("Tex1", "Tex2"))
-        if not tex2.exists():
+    if ".Tex1" in Path(file_name).suffixes and max({i.MipCount for i in list(res_file.Textures.Values)}) > 1:
+        if tex2 is None:
             raise FileNotFoundError("Could not find Tex2 file for mipmap data.")
 
-        res_file_tex2 = ResFile(MemoryStream(util.unyaz_if_needed(tex2.read_bytes())))
+        res_file_tex2 = dotnet.ResFile(dotnet.to_stream(util.unyaz_if_needed(tex2)))
         for texture in list(res_file_tex2.Textures.Values):
             res_file.Textures[texture.Name].MipSwizzle = texture.Swizzle
             res_file.Textures[texture.Name].MipData = texture.MipData
 
         name = name.replace("Tex1", "Tex")
         res_file.Name = name
-    
-    if not res_file.IsPlatformSwitch:
-        res_file.ChangePlatform(True, 4096, 0, 5, 0, 3, ConverterHandle.BOTW)
-        res_file.Alignment = 0x08 if sbfres.suffix == ".bcamanim" else 0x0C
-
-        if sbfres.suffix.startswith(".s"):
-            mem = MemoryStream()
-            res_file.Save(mem)
-            sbfres.write_bytes(oead.yaz0.compress(bytes(mem.ToArray())))
-        else:
-            res_file.Save(str(sbfres))
-        
-        if ".Tex1" in sbfres.suffixes:
+        timings.append(("tex2", time.perf_counter()))
+
+    if res_file.IsPlatformSwitch:
+        return None
+
+    res_file.ChangePlatform(True, 4096, 0, 5, 0, 3, dotnet.ConverterHandle.BOTW)
+    res_file.Alignment = 0x08 if ext == ".bcamanim" else 0x0C
+    timings.append(("change platform", time.perf_counter()))
+
+    new_bfres = dotnet.save(res_file)
+    timings.append(("save", time.perf_counter()))
+
+    if ext.startswith(".s"):
+        new_bfres = oead.yaz0.compress(new_bfres)
+        timings.append(("compress", time.perf_counter()))
+
+    logger.debug(f"{file_name}: " + ", ".join(
+        f"{step} {end - start:.3f}s" for (_, start), (step, end) in zip(timings, timings[1:])
+    ))
+    return f'{name}{ext}', bytes(new_bfres)
+
+def convert_bfres(sbfres: Path, file: Optional[FileContext] = None) -> None:
+    file = file or FileContext(sbfres.name, path=sbfres)
+    tex2: Path = Path(str(sbfres).replace("Tex1", "Tex2"))
+    converted = convert_bfres_data(
+        file, tex2.read_bytes() if ".Tex1" in sbfres.suffixes and tex2.exists() else None
+    )
+
+    if converted:
+        new_name, new_bfres = converted
+        sbfres.write_bytes(new_bfres)
+
+        if ".Tex1" in sbfres.suffixes and tex2.exists():
             tex2.unlink()
-            
-        sbfres.rename(sbfres.with_name(f'{name}{ext}'))
-
-def convert_havok(hkx: Path) -> None:
-    # Convert havok files unsupported by BCML
-    hkx_c = SCRIPT / "HKXConvert.exe" if system() == "Windows" else SCRIPT / "HKXConvert"
-    # Make sure we can run the program by setting the correct permissions
-    hkx_c.chmod(0o755)
-
-    # Convert every hkx found into json, and then to switch
-    print(f"Converting {hkx.name}")
-    if hkx.suffix.startswith(".s"):
-        unyazed_hkx = util.unyaz_if_needed(hkx.read_bytes())
-        hkx.write_bytes(unyazed_hkx)
-
-    run([str(hkx_c), 'hkx2json', str(hkx)])
-    hkx.unlink()
-    run([str(hkx_c), 'json2hkx', '--nx', f'{splitext(hkx)[0]}.json', str(hkx)])
-    Path(f'{splitext(hkx)[0]}.json').unlink()
-
-    if hkx.suffix.startswith(".s"):
-        yaz0_hkx = oead.yaz0.compress(hkx.read_bytes())
-        hkx.write_bytes(yaz0_hkx)
-
-def get_stock_bfstp(bfstp_name: str, bars_file: Path):
-    # Look for the bars file containing the bfstp
-    try:
-        stock_bars = util.get_game_file(f"Sound/Resource/{bars_file.name}")
-        stock_tracks,_ = bars.get_bars_tracks(stock_bars.read_bytes())
-    except FileNotFoundError:
-        # If there's no loose bars file, find one inside packs
+
+        sbfres.rename(sbfres.with_name(new_name))
+
+def convert_havok_files(files: List[FileContext]) -> List[Union[bytes, Exception]]:
+    """
+    Convert havok files unsupported by BCML in a single HKXConvert batch,
+    skipping the ones found in the conversion cache. Returns the new data
+    of each file, in order, or the exception that made it fail.
+    """
+    results: List[Union[bytes, Exception, None]] = [None] * len(files)
+    keys: List[Optional[str]] = [None] * len(files)
+    batch = []
+    for i, file in enumerate(files):
         try:
-            # Look in regular packs
-            stock_pack = util.get_game_file(f'Pack/{bars_file.parent.parent.parent.name}')
-            stock_bars = oead.Sarc(stock_pack.read_bytes()).get_file(f"Sound/Resource/{bars_file.name}")
-            # Get the stock tracks
-            stock_tracks, stock_offsets = bars.get_bars_tracks(bytearray(stock_bars.data))
-        except FileNotFoundError:
-            # Look in event packs
-            stock_pack = util.get_game_file(f'Event/{bars_file.parent.parent.parent.name}')
-            stock_bars = oead.Sarc(util.unyaz_if_needed(stock_pack.read_bytes())).get_file(f"Sound/Resource/{bars_file.name}")
-            if not isinstance(stock_bars, oead.File):
-                raise FileNotFoundError(f"File Sound/Resource/{bars_file.name} was not found in game dump.")
-            # Get the stock tracks
-            stock_tracks, stock_offsets = bars.get_bars_tracks(bytearray(stock_bars.data))
+            if conversion_cache is not None:
+                # Only the extension changes the output, by compressing it
+                keys[i] = conversion_cache.key("havok", Path(file.name).suffix, file.hash)
+                results[i] = conversion_cache.get(keys[i])
+            if results[i] is None:
+                # HKXConvert can't read compressed files
+                batch.append((i, file.name, file.data if Path(file.name).suffix.startswith(".s") else file.raw))
+        except Exception as err:
+            results[i] = err
+
+    converted = havok.convert_batch([(name, data) for _, name, data in batch], hkx_procs)
+    for (i, name, _), new_hkx in zip(batch, converted):
+        if not isinstance(new_hkx, Exception):
+            if Path(name).suffix.startswith(".s"):
+                new_hkx = bytes(oead.yaz0.compress(new_hkx))
+            if keys[i] is not None:
+                conversion_cache.put(keys[i], new_hkx)
+        results[i] = new_hkx
+
+    return results
+
+def convert_havok_data(file: FileContext) -> bytes:
+    new_hkx = convert_havok_files([file])[0]
+    if isinstance(new_hkx, Exception):
+        raise new_hkx
+    return new_hkx
+
+def convert_havok(hkx: Path, file: Optional[FileContext] = None) -> None:
+    hkx.write_bytes(convert_havok_data(file or FileContext(hkx.name, path=hkx)))
+
+def convert_bfstm(bfstm: Path, file: Optional[FileContext] = None) -> None:
+    key = None
+    if conversion_cache is not None:
+        key = conversion_cache.key("bfstm", (file or FileContext(bfstm.name, path=bfstm)).hash)
+        if conversion_cache.get_file(key, bfstm):
+            return
+
+    # Stream the track to a temporary file, so it's never fully loaded
+    tmp_file = bfstm.with_name(f"{bfstm.name}.tmp")
+    try:
+        with open(bfstm, "rb") as inf, open(tmp_file, "wb") as outf:
+            converted = bcf_converter.conv_stream(inf, outf, "FSTM", '<')
+        if not converted:
+            raise ValueError(f"{bfstm.name} could not be converted")
+        if key is not None:
+            conversion_cache.put_file(key, tmp_file)
+        os.replace(tmp_file, bfstm)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+def get_stock_bfstp(bfstp_name: str, bars_name: str, pack_name: str):
+    # Look for the bars file containing the bfstp, loose or inside of a pack
+    stock_tracks = get_stock_bars_tracks(find_stock_file(f"Sound/Resource/{bars_name}", pack_name))
     return stock_tracks[bfstp_name]
 
-def convert_bflim(sblarc: Path, pack_name: str) -> None:
-    # Convert bflim files inside a WiiU sblarc
-    blarc = oead.Sarc(util.unyaz_if_needed(sblarc.read_bytes()))
-    blarc_path = SCRIPT / sblarc.name
-
-    if any("bflim" in i.name for i in blarc.get_files()):
-        # Get the pack file where the sblarc comes from
-        stock_pack = util.get_game_file(f"Pack/{pack_name}")
-
-        if pack_name == "Bootup.pack":
-            # If the sblarc is in Bootup.pack, get a stock Common.sblarc
-            stock_sblarc = oead.Sarc(stock_pack.read_bytes()).get_file("Layout/Common.sblarc")
-            stock_blarc = oead.Sarc(util.unyaz_if_needed(stock_sblarc.data))
-
-        elif pack_name == "Title.pack":
-            # If the sblarc is in Title.pack, get a stock Title.sblarc
-            stock_sblarc = oead.Sarc(stock_pack.read_bytes()).get_file("Layout/Title.sblarc")
-            stock_blarc = oead.Sarc(util.unyaz_if_needed(stock_sblarc.data))
-
-        # Get a stock bntx file
-        bntx_file = stock_blarc.get_file("timg/__Combined.bntx")
-        extract_sarc(blarc, blarc_path)
-        Path(blarc_path / bntx_file.name).write_bytes(bntx_file.data)
-
-        for bflim in blarc_path.rglob('*.bflim'):
-            try:
-                # Inject every bflim found into the bntx file
-                bntx.tex_inject(blarc_path / bntx_file.name, bflim)
-                Path(bflim).unlink()
-            except Exception as err:
-                logging.warning(f"{bflim.relative_to(blarc_path)} could not be converted")
-                logging.debug(err, exc_info=True)
-        # Write the new blarc file
-        write_sarc(blarc, blarc_path, sblarc)
-
-        # Remove the temporary folder
-        shutil.rmtree(blarc_path)
-
-def change_platform(file: Path, mod_path: Path, root_mod_path: Path = None) -> None:
-    if file.suffix in BFRES_EXT:
+def convert_bars_track(name: str, data, bars_name: str, pack_name: str, has_bfstm: Callable[[str], bool]):
+    # Read the track header and convert appropiately, returns None if the track is kept as is
+    magic: str = bytes(data[:0x4]).decode("utf-8")
+
+    if magic == 'FWAV':
+        return bcf_converter.conv_file(data, magic, '<')
+
+    elif magic == 'FSTP' and has_bfstm(name):
+        return bcf_converter.conv_file(data, magic, '<')
+
+    elif magic == 'FSTP':
+        return get_stock_bfstp(name, bars_name, pack_name)
+
+    return None
+
+def convert_bars_data(file: FileContext, pack_name: str, has_bfstm: Callable[[str], bool]) -> bytearray:
+    # Convert bars files, working on a single copy of the file. Tracks are converted one
+    # after the other: the pool already has a worker per CPU, and big bars files are
+    # scheduled first by schedule_files so they don't end up alone at the end of the run
+    bars_name: str = Path(file.name).name
+    bars_file = bars.BarsFile(file.data)
+    for name in bars_file.names:
+        new_track = convert_bars_track(name, bars_file.tracks[name], bars_name, pack_name, has_bfstm)
+        if new_track is not None:
+            bars_file.replace_track(name, new_track)
+
+    new_bars = bars_file.convert('<')
+    print("Successfully converted " + bars_name + "!")
+    return new_bars
+
+def convert_bflim_data(file: FileContext, pack_name: str) -> Optional[bytes]:
+    # Convert bflim files inside a WiiU sblarc, returns None if there are none
+    blarc = oead.Sarc(file.data)
+    files = {file.name: bytes(file.data) for file in blarc.get_files()}
+
+    if not any("bflim" in name for name in files):
+        return None
+
+    if pack_name == "Bootup.pack":
+        # If the sblarc is in Bootup.pack, get a stock Common.sblarc
+        stock_blarc = oead.Sarc(get_stock_file(find_stock_member("Layout/Common.sblarc", pack_name)))
+
+    elif pack_name == "Title.pack":
+        # If the sblarc is in Title.pack, get a stock Title.sblarc
+        stock_blarc = oead.Sarc(get_stock_file(find_stock_member("Layout/Title.sblarc", pack_name)))
+
+    # Get a stock bntx file
+    bntx_file = stock_blarc.get_file("timg/__Combined.bntx")
+    combined = BntxFile(bytes(bntx_file.data))
+
+    # Inject every bflim found into the bntx file
+    bflims = {name: files[name] for name in files if name.endswith(".bflim")}
+    failed = bntx.inject_flims(combined, {Path(name).stem: flim for name, flim in bflims.items()})
+    for name in bflims:
+        err = failed.get(Path(name).stem)
+        if err is not None:
+            logging.warning(f"{name} could not be converted")
+            logging.debug(err, exc_info=err)
+        else:
+            del files[name]
+    files[bntx_file.name] = bytes(combined.buffer)
+
+    # Write the new blarc file
+    return write_sarc(files)
+
+def convert_bflim(sblarc: Path, pack_name: str, file: Optional[FileContext] = None) -> None:
+    new_blarc = convert_bflim_data(file or FileContext(sblarc.name, path=sblarc), pack_name)
+    if new_blarc is not None:
+        sblarc.write_bytes(new_blarc)
+
+def convert_sarc_data(file: FileContext, root_mod_path: Path) -> Optional[bytes]:
+    # Convert files inside of pack files in memory, returns None if nothing needs converting
+    pack_name: str = Path(file.name).name
+    pack = oead.Sarc(file.data)
+    files = {file.name: bytes(file.data) for file in pack.get_files()}
+    if not any(splitext(name)[1] in SUPPORTED for name in files):
+        return None
+
+    names = list(files)
+    new_files = {}
+    for name in names:
+        try:
+            converted = convert_pack_file(name, files, pack_name, root_mod_path)
+        except Exception as err:
+            logger.warning(f"{pack_name}//{name} could not be converted")
+            logger.debug(err, exc_info=True)
+            converted = (name, files[name])
+
+        if converted is not None:
+            new_name, new_data = converted
+            new_files[new_name] = new_data
+
+    # Drop the files that were merged into others while converting
+    for name in names:
+        if name not in files:
+            new_files.pop(name, None)
+
+    return write_sarc(new_files, Path(pack_name).suffix != ".pack")
+
+def get_stock_pack_file(pack_name: str, file_name: str) -> Optional[bytes]:
+    # Look for the stock version of a file inside of a pack file, preferably one called pack_name
+    try:
+        return get_stock_file(find_stock_member(file_name, pack_name))
+    except FileNotFoundError:
+        return None
+
+def change_platform_data(file: FileContext, files: Dict[str, bytes], pack_name: str,
+                         root_mod_path: Path) -> Optional[Tuple[str, bytes]]:
+    # Convert a file inside of a pack file, returns its new name and data,
+    # or None if the file should be removed from the pack
+    name = file.name
+    ext = Path(name).suffix
+
+    if ext in BFRES_EXT:
         # Convert FRES files
-        if ".Tex2" not in file.suffixes:
-            convert_bfres(file)
+        if ".Tex2" not in Path(name).suffixes:
+            tex2 = name.replace("Tex1", "Tex2") if ".Tex1" in Path(name).suffixes else None
+            converted = convert_bfres_data(file, files.get(tex2))
+            if converted:
+                new_name, new_data = converted
+                if tex2:
+                    files.pop(tex2, None)
+                return (Path(name).parent / new_name).as_posix(), new_data
+
+    elif ext == ".bars":
+        pack_bfstms = {Path(i).stem for i in files if i.endswith(".bfstm")}
+
+        def has_bfstm(track: str) -> bool:
+            return track in pack_bfstms or mod_has_bfstm(track, root_mod_path)
+
+        return name, convert_bars_data(file, pack_name, has_bfstm)
+
+    elif ext == ".bfstm":
+        # Convert BFSTM files, the same way as loose ones
+        new_bfstm = cached_conversion("bfstm", lambda: bytes(bcf_converter.conv_file(file.data, "FSTM", '<')), file.hash)
+        print("Successfully converted " + Path(name).name + "!")
+        return name, new_bfstm
+
+    elif "pack" in ext and ext != ".sbquestpack":
+        # Convert nested pack files
+        new_pack = convert_sarc_data(file, root_mod_path)
+        if new_pack is not None:
+            return name, new_pack
+
+    elif ext == ".sblarc":
+        if Path(name).name == "BootUp.sblarc":
+            logging.warning("A BootUp.sblarc was found! These files are not used on Switch, so it was skipped")
+            return None
+        else:
+            # Convert bflim files inside of sblarc files
+            new_blarc = convert_bflim_data(file, pack_name)
+            if new_blarc is not None:
+                return name, new_blarc
 
-    elif file.suffix == ".bars":
-        # Convert bars files
-        bars_bytes = bytearray(file.read_bytes())
-        tracks, offsets = bars.get_bars_tracks(bars_bytes)
-        for name, data in tracks.items():
-            # Read the track header and convert appropiately
-            magic: str = data[:0x4].decode("utf-8")
-            try:
-                try:
-                    bfstm_exists = next(mod_path.rglob(name + ".bfstm"))
-                except StopIteration:
-                    bfstm_exists = next(root_mod_path.rglob(name + ".bfstm"))
-            except:
-                bfstm_exists = None
+    elif ext in HAVOK_EXT:
+        # Convert havok files
+        return name, convert_havok_data(file)
 
-            if magic == 'FWAV':
-                tracks[name] = bcf_converter.conv_file(data, magic, '<')
+    return name, file.raw
 
-            elif magic == 'FSTP' and bfstm_exists:
-                tracks[name] = bcf_converter.conv_file(data, magic, '<')
+def convert_pack_file(name: str, files: Dict[str, bytes], pack_name: str, root_mod_path: Path) -> Optional[Tuple[str, bytes]]:
+    # Convert a single file inside of a pack file
+    data = files.get(name)
+    if data is None:
+        # Already consumed by another file, like a Tex2 bfres
+        return None
 
-            elif magic == 'FSTP' and not bfstm_exists:
-                tracks[name] = get_stock_bfstp(name, file)
+    file = FileContext(name, data)
+    canon = util.get_canon_name(name, allow_no_source=True)
+    is_modded = is_file_modded(canon, file)
 
-            bars_bytes[offsets[name]:offsets[name] + len(tracks[name])] = tracks[name]
+    if len(data) == 0:
+        return name, data
 
-        new_bars = bars.convert_bars(bars_bytes, '<')
-        file.write_bytes(bytes(new_bars))
-        print("Successfully converted " + file.name + "!")
+    if is_modded:
+        return change_platform_data(file, files, pack_name, root_mod_path)
+
+    elif Path(name).suffix in NO_CONVERT_EXTS or Path(name).suffix == ".bcamanim":
+        stock_file = get_stock_pack_file(pack_name, name)
+        if stock_file is not None:
+            return name, stock_file
+        return change_platform_data(file, files, pack_name, root_mod_path)
+
+    return name, data
+
+def change_platform(file: Path, mod_path: Path, root_mod_path: Path = None, context: Optional[FileContext] = None) -> None:
+    context = context or FileContext(file.name, path=file)
+
+    if file.suffix in BFRES_EXT:
+        # Convert FRES files
+        if ".Tex2" not in file.suffixes:
+            convert_bfres(file, context)
+
+    elif file.suffix == ".bars":
+        # Convert bars files
+        def has_bfstm(track: str) -> bool:
+            return mod_has_bfstm(track, mod_path) or mod_has_bfstm(track, root_mod_path)
+
+        file.write_bytes(convert_bars_data(context, file.parent.parent.parent.name, has_bfstm))
 
     elif file.suffix == ".bfstm":
         # Convert BFSTM files
-        new_bfstm = bcf_converter.conv_file(file.read_bytes(), "FSTM", '<')
-        file.write_bytes(bytes(new_bfstm))
+        convert_bfstm(file, context)
         print("Successfully converted " + file.name + "!")
 
     elif "pack" in file.suffix and file.suffix != ".sbquestpack":
         # Convert files inside of pack files
-        pack = oead.Sarc(util.unyaz_if_needed(file.read_bytes()))
-        pack_path = SCRIPT / file.name
-        if any(splitext(i.name)[1] in SUPPORTED for i in pack.get_files()):
-            try:
-                extract_sarc(pack, pack_path)
-                new_files = pack_path.rglob('*.*')
-                for new in new_files:
-                    try:
-                        convert_files(new, pack_path, mod_path)
-                    except Exception as err:
-                        logger.warning(f"{new.relative_to(pack_path)} could not be converted")
-                        logger.debug(err, exc_info=True)
-                write_sarc(pack, pack_path, file)
-                
-            finally:
-                shutil.rmtree(pack_path)
+        new_pack = convert_sarc_data(context, mod_path)
+        if new_pack is not None:
+            file.write_bytes(new_pack)
 
     elif file.suffix == ".sblarc":
         if file.name == "BootUp.sblarc":
@@ -291,59 +638,242 @@ def change_platform(file: Path, mod_path: Path, root_mod_path: Path = None) -> N
             file.unlink()
         else:
             # Convert bflim files inside of sblarc files
-            convert_bflim(file, mod_path.name)
+            convert_bflim(file, mod_path.name, context)
 
     elif file.suffix in HAVOK_EXT:
         # Convert havok files
-        convert_havok(file)
+        convert_havok(file, context)
 
-def convert_files(file: Path, mod_path: Path, root_mod_path = None) -> None:
+def convert_files(file: Path, mod_path: Path, root_mod_path = None) -> bool:
+    # Returns False if the file could not be converted
     try:
+        # Read the file only once for the whole conversion
+        context = FileContext(file.name, path=file)
         canon = util.get_canon_name(file.relative_to(mod_path), allow_no_source=True)
-        is_modded = is_file_modded(canon, file.read_bytes())
+        is_modded = is_file_modded(canon, context)
 
         # Convert supported files
-        if file.exists() and file.stat().st_size != 0:
+        if context.size != 0:
             if is_modded: 
-                change_platform(file, mod_path, root_mod_path)
+                change_platform(file, mod_path, root_mod_path, context)
                 
             elif file.suffix in NO_CONVERT_EXTS or file.suffix == ".bcamanim":
-                if mod_path.parent != SCRIPT:
-                    stock_file = util.get_game_file(file.relative_to(mod_path / "content"))
-                    file.write_bytes(stock_file.read_bytes())
-                # TODO: Add logic for stock files inside modified packs
-                elif "pack" in mod_path.suffix and mod_path.suffix != ".sbquestpack":
-                    try:
-                        stock_pack = util.get_game_file(f"Actor/Pack/{mod_path.name}")
-                    except FileNotFoundError:
-                        try:
-                            stock_pack = util.get_game_file(f"Event/{mod_path.name}")
-                        except FileNotFoundError:
-                            try:
-                                stock_pack = util.get_game_file(f"Pack/{mod_path.name}")
-                            except FileNotFoundError:
-                                try:
-                                    stock_pack = util.get_game_file(f"Actor/Pack/{file.name.split('.')[0].replace('_A', '')}.sbactorpack")
-                                except FileNotFoundError:
-                                    try:
-                                        stock_pack = util.get_game_file(f"Event/{file.name.split('.')[0].replace('Event_', '').replace('_Open', '_0')}.sbeventpack")
-                                    except FileNotFoundError:
-                                        change_platform(file, mod_path)
-
-                    if 'stock_pack' in locals():
-                        try:
-                            stock_file = util.get_nested_file_bytes(f"{stock_pack}//{file.relative_to(mod_path).as_posix()}")
-                            file.write_bytes(stock_file)
-                        except:
-                            change_platform(file, mod_path)
+                stock_file = get_game_file(file.relative_to(mod_path / "content"))
+                file.write_bytes(stock_file.read_bytes())
                 
     except Exception as err:
         logger.warning(f"{file.relative_to(mod_path)} could not be converted")
         logger.debug(err, exc_info=True)
+        return False
+    return True
+
+def convert_havok_batch(files: List[Path], mod_path: Path) -> List[Path]:
+    """
+    Convert the modded loose havok files of a batch with a single HKXConvert
+    batch, and replace the unmodded ones with their stock version, like
+    convert_files does. Returns the files that failed.
+    """
+    failed = []
+    batch = []
+    for file in files:
+        try:
+            context = FileContext(file.name, path=file)
+            canon = util.get_canon_name(file.relative_to(mod_path), allow_no_source=True)
+            if context.size == 0:
+                continue
+            if is_file_modded(canon, context):
+                batch.append((file, context))
+            elif file.suffix in NO_CONVERT_EXTS:
+                stock_file = get_game_file(file.relative_to(mod_path / "content"))
+                file.write_bytes(stock_file.read_bytes())
+        except Exception as err:
+            logger.warning(f"{file.relative_to(mod_path)} could not be converted")
+            logger.debug(err, exc_info=True)
+            failed.append(file)
+
+    for (file, _), new_hkx in zip(batch, convert_havok_files([context for _, context in batch])):
+        if isinstance(new_hkx, Exception):
+            logger.warning(f"{file.relative_to(mod_path)} could not be converted")
+            logger.debug(new_hkx, exc_info=new_hkx)
+            failed.append(file)
+        else:
+            file.write_bytes(new_hkx)
+    return failed
+
+def classify_file(file: Path) -> Optional[str]:
+    # Get the converter a file will go through, or None if it doesn't need one
+    if file.suffix in BFRES_EXT:
+        return "bfres"
+    elif file.suffix in HAVOK_EXT:
+        return "havok"
+    elif file.suffix == ".bars":
+        return "bars"
+    elif file.suffix == ".bfstm":
+        return "bfstm"
+    elif file.suffix == ".sblarc":
+        return "bflim"
+    elif "pack" in file.suffix and file.suffix != ".sbquestpack":
+        return "pack"
+    elif file.suffix in NO_CONVERT_EXTS:
+        # Might be replaced with its stock version
+        return "stock"
+    return None
+
+def estimate_cost(file: Path, kind: str) -> int:
+    # Estimate how long a file will take to convert, from its headers only
+    size = file.stat().st_size
+    members = 0
+    with open(file, "rb") as f:
+        header = f.read(0x20)
+    if header[0:4] == b"Yaz0":
+        # Use the decompressed size
+        size = int.from_bytes(header[4:8], "big")
+    elif kind == "pack" and header[0:4] == b"SARC" and header[0x14:0x18] == b"SFAT":
+        bom = "big" if header[6:8] == b"\xFE\xFF" else "little"
+        members = int.from_bytes(header[0x1A:0x1C], bom)
+    return size * CONVERTER_COST[kind] + JOB_OVERHEAD.get(kind, 0) + members * PACK_MEMBER_COST
+
+def schedule_files(files: List[Path], mod_path: Path) -> List[Tuple[Union[Path, Tuple[Path, ...]], Path]]:
+    """
+    Get the conversion jobs of a mod, most expensive first, so big files
+    don't end up alone at the end of the run. Files that don't go through
+    any converter are skipped, and havok files are grouped in batch jobs of
+    up to HAVOK_BATCH_SIZE files.
+    """
+    jobs = []
+    havok_files = []
+    for file in files:
+        kind = classify_file(file)
+        if kind is None:
+            continue
+        try:
+            cost = estimate_cost(file, kind)
+        except OSError:
+            cost = 0
+        if kind == "havok":
+            havok_files.append((cost, file))
+        else:
+            jobs.append((cost, file))
+    if havok_files:
+        # Deal the files out from the most expensive, so the batches cost about the same
+        havok_files.sort(key=lambda job: job[0], reverse=True)
+        batches = -(-len(havok_files) // HAVOK_BATCH_SIZE)
+        for i in range(batches):
+            batch = havok_files[i::batches]
+            jobs.append((sum(cost for cost, _ in batch), tuple(file for _, file in batch)))
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return [(file, mod_path) for _, file in jobs]
+
+def convert_job(job: Tuple[Union[Path, Tuple[Path, ...]], Path]) -> List[Path]:
+    # Single-argument convert_files, for Pool.imap_unordered, returns the files that failed
+    file, mod_path = job
+    if isinstance(file, tuple):
+        return convert_havok_batch(list(file), mod_path)
+    return [] if convert_files(file, mod_path) else [file]
+
+class ConversionPool:
+    """
+    The workers converting the files of a mod, started once and reused for
+    every mod of a run, even while several of them are in flight. Use it
+    as a context manager, so the workers are stopped at the end.
+    """
+
+    def __init__(self, options: ConvertOptions):
+        self.options = options
+        self.cache = ConversionCache(Path(options.cache_dir)) if options.cache_dir else None
+
+        self._pool = None
+        if not options.single:
+            self._pool = self._start(options.preload)
+
+        # Build the hash and game indexes once, so the workers only have to map them
+        get_hash_index(HASH_INDEX, True)
+        # Packs are spread over the workers when the game index has to be built
+        map_func = map if self._pool is None else partial(self._pool.imap, chunksize=16)
+        try:
+            with bcml_lock, util.TempSettingsContext(WORKER_SETTINGS):
+                # The stock files come from the dump the workers use
+                get_game_index(check=True, map_func=map_func)
+        except BaseException:
+            if self._pool is not None:
+                self._pool.terminate()
+            raise
+
+    def _start(self, preload: bool):
+        start_method = "spawn"
+        if preload and "forkserver" in get_all_start_methods():
+            start_method = "forkserver"
+        elif preload:
+            logger.warning("Preloaded workers are not supported on this platform, starting them from scratch")
+        context = get_context(start_method)
+        if start_method == "forkserver":
+            context.set_forkserver_preload(PRELOAD_MODULES)
+
+        started = time.time()
+        initargs = (self.cache, self.options.log_level, WORKER_SETTINGS, HKX_PROCS_PER_WORKER)
+        pool = context.Pool(maxtasksperchild=500, initializer=init_worker, initargs=initargs)
+        # Wait for the first worker, to see how long starting one takes
+        ready = pool.apply(worker_ready_at)
+        logger.info(f"First {start_method} worker ready after {ready - started:.3f}s")
+        return pool
+
+    def run(self, jobs: List[Tuple[Union[Path, Tuple[Path, ...]], Path]]) -> List[Path]:
+        # Convert the jobs of a mod, returns the files that failed
+        failed = []
+        if self._pool is not None:
+            for job_failed in self._pool.imap_unordered(convert_job, jobs):
+                failed.extend(job_failed)
+        else:
+            with bcml_lock, util.TempSettingsContext(WORKER_SETTINGS):
+                init_worker(self.cache)
+                try:
+                    for job in jobs:
+                        failed.extend(convert_job(job))
+                finally:
+                    init_worker(None)
+        return failed
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        if self.cache is not None:
+            # Keep the cache under its size limit, now that no worker is using it
+            self.cache.evict()
+
+    def __enter__(self) -> "ConversionPool":
+        return self
+
+    def __exit__(self, exctype, excinst, exctb) -> None:
+        if exctype is not None and self._pool is not None:
+            self._pool.terminate()
+        self.close()
+
+def convert(mod: Path, options: Optional[ConvertOptions] = None, pool: Optional[ConversionPool] = None) -> ConvertResult:
+    """
+    Convert a WiiU mod in BNP format to Switch, returning where the new
+    bnp was written and what went wrong. Errors are reported in the
+    result instead of being raised. If no pool is given, one is started
+    only for this mod, see convert_mods to convert many of them.
+    """
+    options = options or ConvertOptions()
+    if pool is None:
+        with ConversionPool(options) as pool:
+            return convert(mod, options, pool)
+
+    result = ConvertResult(Path(mod))
 
-def convert(mod: Path) -> None:
     # Open the mod
-    mod_path = open_mod(mod)
+    try:
+        with bcml_lock:
+            mod_path = open_mod(mod)
+    except Exception:
+        result.error = traceback.format_exc()
+        print(result.error)
+        return result
+
     try:
         if (mod_path / "info.json").exists():
             meta = loads((mod_path / "info.json").read_text("utf-8"))
@@ -354,24 +884,19 @@ def convert(mod: Path) -> None:
         files = []
         for file in mod_path.rglob("*.*"):
             if "content" in file.parts or "aoc" in file.parts:
-                files.append((file, mod_path))
+                files.append(file)
+        jobs = schedule_files(files, mod_path)
 
         # Convert supported files
-        with util.TempSettingsContext({"wiiu": False}):
-            if not args.single:
-                with get_context("spawn").Pool(maxtasksperchild=500) as pool:
-                    pool.starmap(convert_files, files)
-                    pool.close()
-                    pool.join()
-            else:
-                for file,_ in files:
-                    convert_files(file, mod_path)
+        failed = pool.run(jobs)
+        result.failed = sorted(file.relative_to(mod_path) for file in failed)
         
         # Run the mod through BCML's automatic converter 
-        warnings = convert_mod(mod_path, False, True)
+        with bcml_lock:
+            warnings = convert_mod(mod_path, False, True)
 
         # Pack the converted mod into a new bnp
-        out = Path(f'{args.output}.bnp') if args.output else mod.with_name(f"{mod.stem}_switch.bnp")
+        out = Path(f'{options.output}.bnp') if options.output else Path(mod).with_name(f"{Path(mod).stem}_switch.bnp")
         if Path(out).exists():
             Path(out).unlink()
 
@@ -382,31 +907,79 @@ def convert(mod: Path) -> None:
             f'{str(mod_path / "*")}',
         ]
         run(x_args)
+        result.output = out
 
         # Write BCML's warning to a file
         if warnings:
-            with open(ERROR_LOG, "a", encoding="utf-8") as file:
-                for warning in warnings:
-                    # Write BCML's warning to a file    
-                    if all(i not in warning for i in SUPPORTED):
-                        logger.warning(warning)
+            for warning in warnings:
+                if all(i not in warning for i in SUPPORTED):
+                    logger.warning(warning)
+                    result.warnings.append(warning)
 
     except Exception as err:
-        print(traceback.format_exc())
+        result.error = traceback.format_exc()
+        print(result.error)
 
     finally:
         # Remove the temporary mod_path
         shutil.rmtree(mod_path, ignore_errors=True)
 
+    return result
+
+# How many mods are converted at once, so one can be extracted or packed while others are converted
+MODS_IN_FLIGHT = 3
+
+def convert_mods(mods: List[Path], options: Optional[ConvertOptions] = None) -> List[ConvertResult]:
+    """
+    Convert many mods with a single pool of workers, with up to MODS_IN_FLIGHT
+    of them in flight. BCML's steps, extracting a mod and running its converter,
+    take turns (see bcml_lock), while the files of one mod are converted by the
+    workers and another one is packed. Results are returned in the same order
+    as the mods. An output file can only be given for a single mod.
+    """
+    options = options or ConvertOptions()
+    if options.output is not None and len(mods) > 1:
+        raise ValueError(f"An output file was given for {len(mods)} mods, they would all be written to it")
+    with ConversionPool(options) as pool:
+        if options.single:
+            # BCML's settings are changed for the whole process in single core mode
+            return [convert(mod, options, pool) for mod in mods]
+
+        with ThreadPoolExecutor(max_workers=MODS_IN_FLIGHT) as executor:
+            return list(executor.map(lambda mod: convert(Path(mod), options, pool), mods))
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    # Construct an argument parser
+    parser = argparse.ArgumentParser(description="Converts mods in BNP format using BCML's converter, complemented by some additional tools")
+    parser.add_argument("bnp", nargs='+')
+    parser.add_argument("-o", "--output", help="Specify an output file, only when converting a single mod")
+    parser.add_argument("-s", "--single", help="Use single core", action="store_true")
+    parser.add_argument("--cache-dir", help="Keep converted files in this folder, to reuse them when the same file shows up again")
+    parser.add_argument("--preload", help="Start the workers from a process with the converter already loaded, not available on Windows", action="store_true")
+    parser.add_argument("-log", "--log-level", default="warning", help="Set the logging level. Example --log-level debug. Default is warning")
+    return parser.parse_args(argv)
+
 def main() -> None:
+    args = parse_args()
+    setup_logging(args.log_level)
+    options = ConvertOptions(
+        output=Path(args.output) if args.output else None,
+        single=args.single,
+        cache_dir=Path(args.cache_dir) if args.cache_dir else None,
+        log_level=args.log_level,
+        preload=args.preload,
+    )
 
     if len(args.bnp) == 1: # one argument
         mods = glob(args.bnp[0])
     else: # more than one argument
     	mods = args.bnp
+
+    if options.output is not None and len(mods) > 1:
+        print(f"--output can only be used with a single mod, but {len(mods)} were given.")
+        sys.exit(1)
     
-    for mod in mods:
-        convert(Path(mod))
+    convert_mods([Path(mod) for mod in mods], options)
 
     if ERROR_LOG.stat().st_size != 0:
         print(f"It seems some files could not be converted. Please check the error log at {ERROR_LOG} for more info.")
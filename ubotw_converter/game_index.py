@@ -0,0 +1,241 @@
+"""game_index.py: a persisted index of every file in the game dump, loose or inside of a pack"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from json import dumps, loads
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import logging
+import mmap
+import os
+import struct
+import threading
+import xxhash
+
+from bcml import util
+
+GAME_INDEX: Path = Path(__file__).parent / "cache" / "game.idx"
+
+INDEX_MAGIC = b"UBGI"
+INDEX_VERSION = 1
+
+# magic, version, dump fingerprint, entry count, size of the file table
+IndexHeader = struct.Struct("<4sIQQQ")
+# Offset of the entries which are loose files instead of pack members
+LOOSE = 0xFFFFFFFFFFFFFFFF
+
+# Archives whose members are indexed
+SARC_EXTS = {
+    ".sarc", ".pack", ".bactorpack", ".sbactorpack", ".beventpack", ".sbeventpack",
+    ".bmodelsh", ".sbmodelsh", ".blarc", ".sblarc", ".bfarc", ".sbfarc", ".stera", ".sstera",
+}
+
+logger = logging.getLogger(__name__)
+
+class StockFile(NamedTuple):
+    # Where a stock file is in the dump: the file holding it, and for pack
+    # members, where it is inside of the decompressed pack
+    path: str
+    offset: Optional[int] = None
+    size: Optional[int] = None
+
+def name_hash(name: str) -> int:
+    return xxhash.xxh64_intdigest(name.encode("utf-8"))
+
+def sarc_members(data: bytes) -> Iterator[Tuple[str, int, int]]:
+    # The name, offset and size of every named file of a SARC, read straight from its tables
+    if data[:4] != b"SARC":
+        raise ValueError("Not a SARC file")
+    bom = ">" if data[6:8] == b"\xfe\xff" else "<"
+    header_size, = struct.unpack_from(f"{bom}H", data, 0x4)
+    data_offset, = struct.unpack_from(f"{bom}I", data, 0xC)
+    sfat_size, node_count = struct.unpack_from(f"{bom}HH", data, header_size + 0x4)
+    nodes = header_size + sfat_size
+    names = nodes + node_count * 0x10 + 0x8
+
+    for i in range(node_count):
+        _, attributes, begin, end = struct.unpack_from(f"{bom}4I", data, nodes + i * 0x10)
+        if attributes >> 24 == 0:
+            # Unnamed files can't be looked up
+            continue
+        name_offset = names + (attributes & 0xFFFF) * 4
+        name = bytes(data[name_offset:data.index(b"\0", name_offset)]).decode("utf-8")
+        yield name, data_offset + begin, end - begin
+
+def get_game_roots() -> List[Path]:
+    # The folders util.get_game_file looks into, in the same order
+    roots = []
+    if util.get_settings("wiiu"):
+        roots.append(util.get_update_dir())
+    roots.append(util.get_game_dir())
+    try:
+        roots.append(util.get_aoc_dir())
+    except FileNotFoundError:
+        pass
+    return roots
+
+def scan_game_dump(roots: List[Path]) -> Tuple[int, Dict[str, int]]:
+    """
+    Lists the files of the dump, as game paths mapped to the root they're
+    taken from, and fingerprints their names, sizes and modification times
+    """
+    digest = xxhash.xxh64()
+    files: Dict[str, int] = {}
+    for root_id, root in enumerate(roots):
+        digest.update(f"{root}\0".encode("utf-8"))
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = Path(dirpath) / filename
+                stat = path.stat()
+                game_path = path.relative_to(root).as_posix()
+                digest.update(f"{game_path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode("utf-8"))
+                # The first root with the file wins, like in util.get_game_file
+                files.setdefault(game_path, root_id)
+    return digest.intdigest(), files
+
+def index_pack(path: Path) -> List[Tuple[int, int, int]]:
+    # The name hash, offset and size of every member of a pack, empty if it can't be read
+    try:
+        data = bytes(util.unyaz_if_needed(path.read_bytes()))
+        return [(name_hash(name), offset, size) for name, offset, size in sarc_members(data)]
+    except (ValueError, RuntimeError, struct.error) as err:
+        logger.debug(f"Could not index {path}: {err}")
+        return []
+
+def build_game_index(index_file: Path, roots: List[Path], fingerprint: int, files: Dict[str, int],
+                     map_func: Callable = map) -> None:
+    """
+    Builds the game index from a scan of the dump. Every loose file and every
+    member of a pack is an entry, stored as parallel arrays of name hashes,
+    files, offsets and sizes, sorted by name hash. Packs are read with
+    map_func, which can spread them over a pool of workers.
+    """
+    print("Indexing the game dump, this only happens when it changes...")
+    file_table = list(files.items())
+    paths = [roots[root_id] / game_path for game_path, root_id in file_table]
+    entries = [(name_hash(game_path), file_id, LOOSE, paths[file_id].stat().st_size)
+               for file_id, (game_path, _) in enumerate(file_table)]
+
+    packs = [file_id for file_id, path in enumerate(paths) if path.suffix in SARC_EXTS]
+    for file_id, members in zip(packs, map_func(index_pack, [paths[file_id] for file_id in packs])):
+        entries.extend((nhash, file_id, offset, size) for nhash, offset, size in members)
+    entries.sort()
+
+    strings = dumps({
+        "roots": [str(root) for root in roots],
+        "files": [[root_id, game_path] for game_path, root_id in file_table],
+    }).encode("utf-8")
+
+    # Write to a temporary file first so workers never see a partial index
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = index_file.with_name(f"{index_file.name}.{os.getpid()}.tmp")
+    with open(tmp_file, "wb") as out:
+        out.write(IndexHeader.pack(INDEX_MAGIC, INDEX_VERSION, fingerprint, len(entries), len(strings)))
+        out.write(strings)
+        # Keep the arrays aligned
+        out.write(bytes(-len(strings) % 8))
+        for column, typecode in enumerate("QQQQ"):
+            array(typecode, (entry[column] for entry in entries)).tofile(out)
+    os.replace(tmp_file, index_file)
+
+class GameIndex:
+    """
+    A memory-mapped game index. Finding any stock file, loose or inside of
+    a pack, is a binary search instead of trying every pack it could be in.
+    """
+
+    def __init__(self, index_file: Path):
+        with open(index_file, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.fingerprint, count, strings_size = IndexHeader.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{index_file} is not a valid game index")
+
+        strings = loads(self._map[IndexHeader.size:IndexHeader.size + strings_size].decode("utf-8"))
+        self.roots = [Path(root) for root in strings["roots"]]
+        self.files: List[Tuple[int, str]] = [tuple(file) for file in strings["files"]]
+
+        start = IndexHeader.size + strings_size + (-strings_size % 8)
+        view = memoryview(self._map)[start:start + count * 32]
+        self.names, self.file_ids, self.offsets, self.sizes = (
+            view[column * count * 8:(column + 1) * count * 8].cast("Q") for column in range(4)
+        )
+
+    def _name_range(self, name: str):
+        nhash = name_hash(name)
+        return range(bisect_left(self.names, nhash), bisect_right(self.names, nhash))
+
+    def _game_path(self, i: int) -> str:
+        return self.files[self.file_ids[i]][1]
+
+    def get_game_file(self, game_path: str) -> Path:
+        # The path of a loose file, like util.get_game_file
+        game_path = Path(game_path).as_posix()
+        for i in self._name_range(game_path):
+            if self.offsets[i] == LOOSE and self._game_path(i) == game_path:
+                root_id, _ = self.files[self.file_ids[i]]
+                return self.roots[root_id] / game_path
+        raise FileNotFoundError(f"File {game_path} was not found in the game dump.")
+
+    def find_member(self, name: str, pack_name: str) -> StockFile:
+        """
+        Finds a file inside of the stock packs, in a pack called pack_name
+        if there's one, otherwise in the first pack of the dump holding it
+        """
+        members = [i for i in self._name_range(name) if self.offsets[i] != LOOSE]
+        if not members:
+            raise FileNotFoundError(f"File {name} was not found in any pack of the game dump.")
+        best = next((i for i in members if Path(self._game_path(i)).name == pack_name), None)
+        if best is None:
+            best = members[0]
+            packs = {self._game_path(i) for i in members}
+            if len(packs) > 1:
+                logger.info(f"{name} is in {len(packs)} stock packs but none is called {pack_name}, using {self._game_path(best)}")
+        return StockFile(self._game_path(best), self.offsets[best], self.sizes[best])
+
+    def find(self, name: str, pack_name: str) -> StockFile:
+        # Finds a stock file, loose if possible, otherwise inside of a pack
+        try:
+            self.get_game_file(name)
+        except FileNotFoundError:
+            return self.find_member(name, pack_name)
+        return StockFile(Path(name).as_posix())
+
+_index: Optional[GameIndex] = None
+_lock = threading.Lock()
+
+def get_game_index(index_file: Path = GAME_INDEX, check: bool = False, map_func: Callable = map) -> GameIndex:
+    """
+    Attaches to the game index, building it first if it's missing. With
+    check, the dump is scanned too, to rebuild the index if it changed.
+    See build_game_index for map_func.
+    """
+    global _index
+    with _lock:
+        if _index is not None and not check:
+            return _index
+
+        try:
+            index = GameIndex(index_file)
+        except (FileNotFoundError, ValueError, struct.error):
+            index = None
+
+        if index is None or check:
+            roots = get_game_roots()
+            fingerprint, files = scan_game_dump(roots)
+            if index is None or index.fingerprint != fingerprint:
+                build_game_index(index_file, roots, fingerprint, files, map_func)
+                index = GameIndex(index_file)
+        _index = index
+        return _index
+
+def get_game_file(game_path: str) -> Path:
+    return get_game_index().get_game_file(game_path)
+
+def find_stock_file(name: str, pack_name: str) -> StockFile:
+    return get_game_index().find(name, pack_name)
+
+def find_stock_member(name: str, pack_name: str) -> StockFile:
+    return get_game_index().find_member(name, pack_name)
@@ -0,0 +1,108 @@
+"""hash_index.py: a read-only, memory-mapped index of the vanilla file hashes"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Optional
+import mmap
+import os
+import struct
+import xxhash
+
+from bcml import util
+
+INDEX_MAGIC = b"UBHI"
+INDEX_VERSION = 1
+
+# magic, version, source size, source mtime, entry count
+IndexHeader = struct.Struct("<4sIQQQ")
+
+def name_hash(name: str) -> int:
+    return xxhash.xxh64_intdigest(name.encode("utf-8"))
+
+def get_hash_table_source(wiiu: bool = True) -> Path:
+    # The file BCML builds its hash table from
+    return util.get_exec_dir() / "data" / "hashes" / f'{"wiiu" if wiiu else "switch"}.sjson'
+
+def build_hash_index(index_file: Path, wiiu: bool = True) -> None:
+    """
+    Builds the hash index from BCML's hash table. Entries are stored as two
+    parallel uint64 arrays, name hashes and file hashes, sorted by both.
+    """
+    source = get_hash_table_source(wiiu).stat()
+    table = util.get_hash_table(wiiu)
+
+    pairs = sorted(
+        (name_hash(name), fhash & 0xFFFFFFFFFFFFFFFF)
+        for name, hashes in table.items()
+        for fhash in hashes
+    )
+    names = array("Q", (pair[0] for pair in pairs))
+    hashes = array("Q", (pair[1] for pair in pairs))
+
+    # Write to a temporary file first so workers never see a partial index
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = index_file.with_name(f"{index_file.name}.{os.getpid()}.tmp")
+    with open(tmp_file, "wb") as out:
+        out.write(IndexHeader.pack(INDEX_MAGIC, INDEX_VERSION, source.st_size, source.st_mtime_ns, len(pairs)))
+        names.tofile(out)
+        hashes.tofile(out)
+    os.replace(tmp_file, index_file)
+
+class HashIndex:
+    """
+    A memory-mapped hash index. Since the file is mapped read-only, every
+    worker process shares the same pages instead of parsing its own table.
+    """
+
+    def __init__(self, index_file: Path):
+        with open(index_file, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.source_size, self.source_mtime, count = IndexHeader.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{index_file} is not a valid hash index")
+
+        view = memoryview(self._map)[IndexHeader.size:IndexHeader.size + count * 16]
+        self.names = view[:count * 8].cast("Q")
+        self.hashes = view[count * 8:].cast("Q")
+
+    def is_current(self, wiiu: bool = True) -> bool:
+        # Check if the index was built from the current BCML hash table
+        source = get_hash_table_source(wiiu).stat()
+        return (self.source_size, self.source_mtime) == (source.st_size, source.st_mtime_ns)
+
+    def _name_range(self, name: str):
+        nhash = name_hash(name)
+        return bisect_left(self.names, nhash), bisect_right(self.names, nhash)
+
+    def __contains__(self, name: str) -> bool:
+        start, end = self._name_range(name)
+        return start != end
+
+    def is_stock(self, name: str, fhash: int) -> bool:
+        # Check if a file hash matches any of the vanilla versions of the file
+        start, end = self._name_range(name)
+        pos = bisect_left(self.hashes, fhash, start, end)
+        return pos != end and self.hashes[pos] == fhash
+
+_index: Optional[HashIndex] = None
+
+def get_hash_index(index_file: Path, wiiu: bool = True) -> HashIndex:
+    """
+    Attaches to the hash index, building it first if it's missing or outdated
+    """
+    global _index
+    if _index is None:
+        try:
+            index = HashIndex(index_file)
+            if not index.is_current(wiiu):
+                index = None
+        except (FileNotFoundError, ValueError, struct.error):
+            index = None
+
+        if index is None:
+            build_hash_index(index_file, wiiu)
+            index = HashIndex(index_file)
+        _index = index
+    return _index
@@ -0,0 +1,80 @@
+"""havok.py: converts batches of havok files to Switch with HKXConvert"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from platform import system
+from subprocess import run, PIPE, STDOUT
+from tempfile import TemporaryDirectory
+from typing import List, Optional, Tuple, Union
+import os
+import shutil
+
+HKX_CONVERT: Path = Path(__file__).parent / ("HKXConvert.exe" if system() == "Windows" else "HKXConvert")
+
+# Memory backed folder for HKXConvert's files, so its json never goes through the disk
+TMPFS: Path = Path("/dev/shm")
+# How much bigger than the hkx its json can get, to check there's enough room in TMPFS
+JSON_SIZE_FACTOR = 16
+
+class HavokError(Exception):
+    """HKXConvert could not convert a file"""
+
+def run_hkx_convert(*args: str) -> None:
+    result = run([str(HKX_CONVERT), *args], stdout=PIPE, stderr=STDOUT)
+    if result.returncode != 0:
+        output = result.stdout.decode("utf-8", "replace").strip()
+        raise HavokError(f"HKXConvert {args[0]} failed with code {result.returncode}: {output}")
+
+def convert_hkx(hkx: Path) -> bytes:
+    # Convert the hkx into json, and then to switch
+    json_file = hkx.with_suffix(".json")
+    run_hkx_convert("hkx2json", str(hkx))
+    hkx.unlink()
+    run_hkx_convert("json2hkx", "--nx", str(json_file), str(hkx))
+    return hkx.read_bytes()
+
+def get_tmp_root(needed: int) -> Optional[str]:
+    # Use TMPFS if it's available and big enough, otherwise the default temporary folder
+    try:
+        if os.access(TMPFS, os.W_OK) and shutil.disk_usage(TMPFS).free >= needed:
+            return str(TMPFS)
+    except OSError:
+        pass
+    return None
+
+def convert_batch(files: List[Tuple[str, bytes]], max_procs: Optional[int] = None) -> List[Union[bytes, Exception]]:
+    """
+    Convert a batch of hkx files, given as (name, data) pairs, inside of a
+    single private temporary folder, in memory if possible. HKXConvert takes
+    one file per call, so up to max_procs files are converted at once, by
+    default one per CPU: callers running in a pool should pass their share.
+    Returns the converted data of each file, in order, or the exception
+    that made it fail.
+    """
+    if not files:
+        return []
+
+    # Make sure we can run the program by setting the correct permissions
+    HKX_CONVERT.chmod(0o755)
+
+    max_procs = max_procs or os.cpu_count()
+    # Only the files being converted take up room, each folder is removed when done
+    largest = sorted((len(data) for _, data in files), reverse=True)[:max_procs]
+    with TemporaryDirectory(dir=get_tmp_root(sum(largest) * JSON_SIZE_FACTOR)) as tmp_dir:
+        def convert_file(job: Tuple[int, Tuple[str, bytes]]) -> Union[bytes, Exception]:
+            i, (name, data) = job
+            print(f"Converting {Path(name).name}")
+            # Every file gets its own folder, as names can repeat in a batch
+            folder = Path(tmp_dir) / str(i)
+            folder.mkdir()
+            hkx = folder / Path(name).name
+            try:
+                hkx.write_bytes(data)
+                return convert_hkx(hkx)
+            except Exception as err:
+                return err
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+
+        with ThreadPoolExecutor(max_workers=max_procs) as executor:
+            return list(executor.map(convert_file, enumerate(files)))
@@ -0,0 +1,234 @@
+"""server.py: a long-running conversion service, taking jobs over localhost HTTP"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from json import dumps, loads
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import logging
+import threading
+import time
+
+from bcml import util
+
+from .converter import (
+    MODS_IN_FLIGHT,
+    ConversionPool,
+    ConvertOptions,
+    ConvertResult,
+    bcml_lock,
+    convert,
+    setup_logging,
+)
+
+DEFAULT_PORT = 7777
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """A mod queued for conversion, and its result once it's done"""
+
+    def __init__(self, id: int, mod: Path, output: Optional[Path] = None):
+        self.id = id
+        self.mod = mod
+        self.output = output
+        # queued, running, done or failed
+        self.status = "queued"
+        self.result: Optional[ConvertResult] = None
+        self.queued = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_json(self) -> dict:
+        job = {
+            "id": self.id,
+            "mod": str(self.mod),
+            "status": self.status,
+            "queued": self.queued,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.result is not None:
+            job["output"] = str(self.result.output) if self.result.output else None
+            job["failed"] = [str(file) for file in self.result.failed]
+            job["warnings"] = self.result.warnings
+            job["error"] = self.result.error
+        return job
+
+class ConversionServer:
+    """
+    Converts the mods it's sent with one pool of workers kept alive between
+    jobs, so the hash index, the stock files cached by the workers and the
+    .NET runtime they loaded are reused instead of being set up for every
+    mod. Up to MODS_IN_FLIGHT jobs run at once, the others wait in a queue.
+    Like in convert_mods, jobs only overlap in the workers and while packing:
+    their calls into BCML take turns behind bcml_lock.
+    """
+
+    def __init__(self, options: ConvertOptions):
+        self.options = options
+        self.pool = ConversionPool(options)
+        # BCML's settings are changed for the whole process in single core mode, so jobs run one at a time
+        self._executor = ThreadPoolExecutor(max_workers=1 if options.single else MODS_IN_FLIGHT)
+        self._jobs: Dict[int, Job] = {}
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, mod: Path, output: Optional[Path] = None) -> Job:
+        with self._lock:
+            job = Job(next(self._ids), mod, output)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            job.status = "running"
+            job.started = time.time()
+
+        options = replace(self.options, output=job.output)
+        try:
+            result = convert(job.mod, options, self.pool)
+        except Exception as err:
+            # convert reports its own errors, this is only for the unexpected ones
+            logger.exception(f"Job {job.id} failed")
+            result = ConvertResult(job.mod, error=repr(err))
+
+        with self._lock:
+            job.result = result
+            job.status = "done" if result.output is not None else "failed"
+            job.finished = time.time()
+            idle = all(other.status in ("done", "failed") for other in self._jobs.values())
+
+        if idle:
+            # Don't let BCML's caches grow from one job to the next
+            with bcml_lock:
+                util.clear_all_caches()
+            if self.pool.cache is not None:
+                # No worker is using the conversion cache between jobs
+                self.pool.cache.evict()
+
+    def get(self, id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(id)
+
+    def jobs(self) -> List[dict]:
+        with self._lock:
+            return [job.to_json() for job in self._jobs.values()]
+
+    def status(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+    def close(self) -> None:
+        # Finish the queued jobs before stopping the workers
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs         {"mod": "path/to/mod.bnp", "output": optional} queues a mod
+    GET  /jobs         lists every job
+    GET  /jobs/<id>    the status of a job, and its result once it's done
+    GET  /status       how many jobs are in each state
+    """
+
+    server: "HTTPConversionServer"
+
+    def _send(self, code: int, body) -> None:
+        data = dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        conversion = self.server.conversion
+        parts = self.path.strip("/").split("/")
+        if parts == ["status"]:
+            self._send(200, conversion.status())
+        elif parts == ["jobs"]:
+            self._send(200, conversion.jobs())
+        elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            job = conversion.get(int(parts[1]))
+            if job is None:
+                self._send(404, {"error": f"No job {parts[1]}"})
+            else:
+                self._send(200, job.to_json())
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path.strip("/") != "jobs":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            body = loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            mod = Path(body["mod"])
+            output = Path(body["output"]) if body.get("output") else None
+        except (ValueError, KeyError, TypeError) as err:
+            self._send(400, {"error": f"Invalid job: {err!r}"})
+            return
+        if not mod.is_file():
+            self._send(400, {"error": f"{mod} is not a file"})
+            return
+
+        job = self.server.conversion.submit(mod, output)
+        self._send(202, job.to_json())
+
+    def log_message(self, format: str, *args) -> None:
+        logger.info(f"{self.address_string()} {format % args}")
+
+class HTTPConversionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, conversion: ConversionServer):
+        super().__init__(address, RequestHandler)
+        self.conversion = conversion
+
+def serve(options: ConvertOptions, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+    """
+    Convert the mods sent to host:port until interrupted. Only listens on
+    localhost by default, as jobs name files on this machine.
+    """
+    conversion = ConversionServer(options)
+    try:
+        with HTTPConversionServer((host, port), conversion) as httpd:
+            print(f"Waiting for mods on http://{host}:{httpd.server_address[1]}")
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        conversion.close()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Converts the mods sent to it over HTTP, keeping its workers and caches between them")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on. Default is 127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on. Default is {DEFAULT_PORT}")
+    parser.add_argument("-s", "--single", help="Use single core", action="store_true")
+    parser.add_argument("--cache-dir", help="Keep converted files in this folder, to reuse them when the same file shows up again")
+    parser.add_argument("--preload", help="Start the workers from a process with the converter already loaded, not available on Windows", action="store_true")
+    parser.add_argument("-log", "--log-level", default="warning", help="Set the logging level. Example --log-level debug. Default is warning")
+    return parser.parse_args(argv)
+
+def main() -> None:
+    args = parse_args()
+    # The server runs for a long time, don't wipe the log of its previous runs
+    setup_logging(args.log_level, "a")
+    options = ConvertOptions(
+        single=args.single,
+        cache_dir=Path(args.cache_dir) if args.cache_dir else None,
+        log_level=args.log_level,
+        preload=args.preload,
+    )
+    serve(options, args.host, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""stock_cache.py: a process-level cache of decompressed stock game files"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+import threading
+
+from bcml import util
+
+from .bars_py import bars
+from .game_index import StockFile, get_game_file
+
+# Default memory budget of the cache, in bytes
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+class StockCache:
+    """
+    LRU cache of stock files, evicting the least recently used entries
+    once the total size of the cached data goes over the budget
+    """
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, load: Callable[[], Tuple[Any, int]]) -> Any:
+        # load returns the value to cache and its size in bytes
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self.misses += 1
+
+        value, size = load()
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self.size += size
+                self._evict()
+        return value
+
+    def _evict(self) -> None:
+        # Always keep the newest entry, even if it's over budget by itself
+        while self.size > self.budget and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+
+    def resize(self, budget: int) -> None:
+        with self._lock:
+            self.budget = budget
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+stock_cache = StockCache()
+
+def get_stock_pack(game_path: str) -> bytes:
+    """
+    Gets a decompressed stock SARC (pack, sblarc...) from the game dump.
+    Raises FileNotFoundError if it's not in the dump.
+    """
+    def load():
+        data = util.unyaz_if_needed(get_game_file(game_path).read_bytes())
+        return data, len(data)
+
+    return stock_cache.get(("sarc", game_path), load)
+
+def get_stock_file(stock: StockFile) -> bytes:
+    """
+    Gets the decompressed bytes of a file found in the game index, loose or
+    sliced out of its cached pack
+    """
+    if stock.offset is None:
+        return util.unyaz_if_needed(get_game_file(stock.path).read_bytes())
+    data = memoryview(get_stock_pack(stock.path))
+    return util.unyaz_if_needed(bytes(data[stock.offset:stock.offset + stock.size]))
+
+def get_stock_bars_tracks(stock: StockFile) -> Dict[str, bytes]:
+    # Gets the tracks of a stock bars file found in the game index
+    def load():
+        bars_tracks = bars.get_bars_tracks(bytearray(get_stock_file(stock)))
+        if not bars_tracks:
+            raise ValueError(f"{stock.path} is not a valid bars file")
+        tracks, _ = bars_tracks
+        return tracks, sum(len(track) for track in tracks.values())
+
+    return stock_cache.get(("bars", stock), load)